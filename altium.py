@@ -21,245 +21,306 @@
 # SOFTWARE.
 
 
-import configparser
-from genericpath import isfile
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import mmap
 import os
+import re
 
-from termcolor import colored
+from .compound_file import CompoundFile
 
 
 ALTIUM_SPECIAL_FIELDS = ['Description', 'Library Ref', 'Library Path', 
         'Footprint Ref', 'Footprint Path']
 
-
-def generateDbLibFile(categories, connection_string, filename):
-
-    config = configparser.ConfigParser()
-
-    config['OutputDatabaseLinkFile'] = { 'Version': '1.1' }
-    config['DatabaseLinks'] = {
-        'ConnectionString': connection_string,
-        'AddMode': '3',
-        'RemoveMode': '1',
-        'UpdateMode': '2',
-        'ViewMode': '0',
-        'LeftQuote': '`',
-        'RightQuote': '`',
-        'QuoteTableNames': '1',
-        'UseTableSchemaName': '0',
-        'DefaultColumnType': 'VARCHAR(255)',
-        'LibraryDatabaseType': '',
-        'LibraryDatabasePath': '',
-        'DatabasePathRelative': '0',
-        'TopPanelCollapsed': '0',
-        'LibrarySearchPath': 'symbols;footprints',
-        'OrcadMultiValueDelimiter': ',',
-        'SearchSubDirectories': '0',
-        'SchemaName': '',
-        'LastFocusedTable': ''
-    }
+# Bump this whenever the way names are read from libraries changes, so that
+# existing library indexes are rebuilt.
+LIBRARY_INDEX_VERSION = 2
+
+# Every symbol (footprint) in a SchLib (PcbLib) is a storage in the compound
+# file.  These are the streams inside it that hold the name records.
+LIBRARY_RECORD_STREAMS = {
+    'LibReference': 'Data',
+    'PATTERN': 'Parameters'
+}
+
+
+def generateDbLibFile(categories, connection_string, filename, 
+                      link_options={}):
+
+    # Altium reloads the library on every workstation that has it open
+    # whenever the DbLib changes, so the file is only replaced (atomically)
+    # when its content differs.  Returns True if it was written.
+    content = dbLibContent(categories, connection_string, link_options)
+
+    if fileHash(filename) == hashlib.sha1(content.encode()).hexdigest():
+        return False
+
+    with open(filename + '.tmp', 'w') as f:
+        f.write(content)
+    os.replace(filename + '.tmp', filename)
+
+    return True
+
+
+def dbLibContent(categories, connection_string, link_options={}):
+
+    # The DbLib is written directly rather than through configparser, in the
+    # same format (lower case keys, ' = ' between key and value), so that the
+    # same categories always give the same bytes, and large libraries with
+    # thousands of field maps are fast to generate.
+    sections = []
+
+    sections.append(('OutputDatabaseLinkFile', [('Version', '1.1')]))
+
+    database_links = [
+        ('ConnectionString', connection_string),
+        ('AddMode', '3'),
+        ('RemoveMode', '1'),
+        ('UpdateMode', '2'),
+        ('ViewMode', '0'),
+        ('LeftQuote', '`'),
+        ('RightQuote', '`'),
+        ('QuoteTableNames', '1'),
+        ('UseTableSchemaName', '0'),
+        ('DefaultColumnType', 'VARCHAR(255)'),
+        ('LibraryDatabaseType', ''),
+        ('LibraryDatabasePath', ''),
+        ('DatabasePathRelative', '0'),
+        ('TopPanelCollapsed', '0'),
+        ('LibrarySearchPath', 'symbols;footprints'),
+        ('OrcadMultiValueDelimiter', ','),
+        ('SearchSubDirectories', '0'),
+        ('SchemaName', ''),
+        ('LastFocusedTable', '')
+    ]
+
+    # Settings that depend on the database backend, like identifier quotes.
+    # Keys are case insensitive, and replace the defaults in place.
+    overrides = dict((o.lower(), link_options[o]) for o in link_options)
+    database_links = [(k, overrides.pop(k.lower(), v)) for k, v in database_links]
+    database_links += sorted(overrides.items())
+
+    sections.append(('DatabaseLinks', database_links))
 
     table_index = 1
 
     for c in categories:
-        config['Table%i' % table_index] = {
-            'SchemaName': '',
-            'TableName': c,
-            'Enabled': 'True',
-            'UserWhere': '0',
-            'UserWhereText': '',
-            'BrowserOrder_Sorting': '',
-            'BrowserOrder_Grouping': ''
-        }
+        sections.append(('Table%i' % table_index, [
+            ('SchemaName', ''),
+            ('TableName', c),
+            ('Enabled', 'True'),
+            ('UserWhere', '0'),
+            ('UserWhereText', ''),
+            ('BrowserOrder_Sorting', ''),
+            ('BrowserOrder_Grouping', '')
+        ]))
 
         table_index += 1
 
-    field_map_index = 1
+    field_maps = []
 
     for c in categories:
 
-        options = []
-
         # Add the ID field to every category.  This field is used as the
         # primary key in the database, but is not used anywhere else.
         # We add it here so that the DbLib matches the database.
-        options.append('FieldName=%s.id' % c)
-        options.append('TableNameOnly=%s' % c)
-        options.append('FieldNameOnly=id')
-        options.append('FieldType=1')
-        options.append('ParameterName=')
-        options.append('VisibleOnAdd=False')
-        options.append('AddMode=0')
-        options.append('RemoveMode=0')
-        options.append('UpdateMode=0')
-
-        config['FieldMap%i' % field_map_index] = {
-            'Options': '|'.join(options)
-        }
-        field_map_index += 1
-
+        field_maps.append(_fieldMap(c, 'id', 1, '', False))
 
         for f in categories[c].fields:
 
-            options = []
-
-            options.append('FieldName=%s.%s' % (c,f.database_name))
-            options.append('TableNameOnly=%s' % c)
-            options.append('FieldNameOnly=%s' % f.database_name)
-            
             # Use the component_id field as the library key in Altium
             if f.database_name == 'component_id':
-                options.append('FieldType=0')
+                field_type = 0
             else:
-                options.append('FieldType=1')
-            
-            
+                field_type = 1
+
             if f.altium_name in ALTIUM_SPECIAL_FIELDS:
-                options.append('ParameterName=[%s]' % f.altium_name)
-            
+                parameter = '[%s]' % f.altium_name
+
             elif f.link:
                 # If we have a link field, we need to add both the URL and the
                 # description field.
-                options2 = []
-                options2.append('FieldName=%s.ComponentLink%iDescription' % (c,f.link_index))
-                options2.append('TableNameOnly=%s' % c)
-                options2.append('FieldNameOnly=ComponentLink%iDescription' % f.link_index)
-                options2.append('FieldType=1')
-                options2.append('ParameterName=ComponentLink%iDescription' % f.link_index)
-                options2.append('VisibleOnAdd=%s' % False)
-                options2.append('AddMode=0')
-                options2.append('RemoveMode=0')
-                options2.append('UpdateMode=0')
-
-                config['FieldMap%i' % field_map_index] = {
-                    'Options': '|'.join(options2)
-                }
-
-                field_map_index += 1
-
-                options.append('ParameterName=ComponentLink%iURL' % f.link_index)
-            
+                description = 'ComponentLink%iDescription' % f.link_index
+                field_maps.append(_fieldMap(c, description, 1, description, 
+                                            False))
+
+                parameter = 'ComponentLink%iURL' % f.link_index
+
             else:
-                options.append('ParameterName=%s' % f.altium_name)
-            
-            options.append('VisibleOnAdd=%s' % f.visibleOnAdd)
-            options.append('AddMode=0')
-            options.append('RemoveMode=0')
-            options.append('UpdateMode=0')
+                parameter = f.altium_name
 
-            config['FieldMap%i' % field_map_index] = {
-                'Options': '|'.join(options)
-            }
+            field_maps.append(_fieldMap(c, f.database_name, field_type, 
+                                        parameter, f.visibleOnAdd))
 
-            field_map_index += 1
+    for i in range(len(field_maps)):
+        sections.append(('FieldMap%i' % (i + 1), [('Options', field_maps[i])]))
 
-    with open(filename, 'w') as f:
-        config.write(f)
+    lines = []
+    for name, options in sections:
+        lines.append('[%s]\n' % name)
+        for key, value in options:
+            # Multi-line values are continued on indented lines, as
+            # configparser writes them.
+            lines.append('%s = %s\n' % (key.lower(), 
+                                         str(value).replace('\n', '\n\t')))
+        lines.append('\n')
 
+    return ''.join(lines)
 
-def getLibraryFiles(alitum_config):
-    
-    symbol_files = {}
-    footprint_files = {}
 
-    try:
-        symbol_dir = os.path.join(os.path.dirname(os.path.realpath(alitum_config['dblib_file'])), 'symbols')
-        files = os.listdir(symbol_dir)
-
-        for f in files:
-            fpath = os.path.join(symbol_dir, f)
-            if not os.path.isfile(fpath):
-                # ignore subfolders (like History)
-                continue
-
-            symbols = []
-            with open(fpath, mode='rb') as lib_file:
-                contents = str(lib_file.read()).split('|')
-                for s in contents:
-                    if 'LibReference' in s:
-                        symbols.append(s.split('=')[1])
-            
-            symbol_files[f.lower()] = symbols
-    except:
-        pass
+def _fieldMap(table, field, field_type, parameter, visible_on_add):
+    return ('FieldName=%s.%s|TableNameOnly=%s|FieldNameOnly=%s|FieldType=%i|'
+            'ParameterName=%s|VisibleOnAdd=%s|AddMode=0|RemoveMode=0|'
+            'UpdateMode=0' % (table, field, table, field, field_type, parameter,
+                              visible_on_add))
+
 
+def fileHash(filename):
+    # SHA-1 of a text file's content, or None if it cannot be read.
+    h = hashlib.sha1()
     try:
-        footprint_dir = os.path.join(os.path.dirname(os.path.realpath(alitum_config['dblib_file'])), 'footprints')
-        files = os.listdir(footprint_dir)
-
-        for f in files:
-            fpath = os.path.join(footprint_dir, f)
-            if not os.path.isfile(fpath):
-                # ignore subfolders (like History)
-                continue
-
-            footprints = []
-
-            with open(fpath, mode='rb') as lib_file:
-                contents = str(lib_file.read()).split('|')
-                for s in contents:
-                    if 'PATTERN' in s:
-                        footprints.append(s.split('=')[1])
-            
-            footprint_files[f.lower()] = footprints
-    except:
-        pass
+        with open(filename, 'r') as f:
+            for chunk in iter(lambda: f.read(1 << 16), ''):
+                h.update(chunk.encode())
+    except (OSError, UnicodeDecodeError):
+        return None
+    return h.hexdigest()
+
+
+def getLibraryFiles(alitum_config, metrics=None):
+
+    library_dir = os.path.dirname(os.path.realpath(alitum_config['dblib_file']))
+
+    # The index remembers the names found in every library file, keyed by
+    # its path, size and modification time, so only changed libraries have
+    # to be read again.
+    index_file = alitum_config.get('library_index', '.library_index.json')
+    if len(index_file) > 0:
+        index_file = os.path.join(library_dir, index_file)
+    workers = alitum_config.getint('library_workers', fallback=os.cpu_count())
+
+    index = {}
+    if len(index_file) > 0:
+        try:
+            with open(index_file, 'r') as f:
+                saved_index = json.load(f)
+            if saved_index.get('version') == LIBRARY_INDEX_VERSION:
+                index = saved_index['files']
+        except (OSError, ValueError, KeyError):
+            index = {}
+
+    libraries = {}
+    for folder, marker in [('symbols', 'LibReference'), ('footprints', 'PATTERN')]:
+        try:
+            for f in os.listdir(os.path.join(library_dir, folder)):
+                fpath = os.path.join(library_dir, folder, f)
+                if not os.path.isfile(fpath):
+                    # ignore subfolders (like History)
+                    continue
+                libraries[fpath] = (folder, f.lower(), marker)
+        except OSError:
+            pass
+
+    new_index = {}
+    changed = []
+
+    for fpath in libraries:
+        stat = os.stat(fpath)
+        entry = index.get(fpath)
+        if (entry is not None and entry['size'] == stat.st_size and 
+                entry['mtime'] == stat.st_mtime_ns):
+            new_index[fpath] = entry
+        else:
+            new_index[fpath] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+            changed.append(fpath)
+
+    jobs = [(fpath, libraries[fpath][2]) for fpath in changed]
+
+    if len(jobs) > 1 and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_readLibraryNames, jobs))
+    else:
+        results = [_readLibraryNames(j) for j in jobs]
+
+    for fpath, names in zip(changed, results):
+        new_index[fpath]['names'] = names
+
+    if metrics is not None:
+        metrics.setCounter('library_files', len(libraries))
+        metrics.setCounter('library_files_parsed', len(changed))
+
+    symbol_files = {}
+    footprint_files = {}
+
+    for fpath in libraries:
+        folder, name, marker = libraries[fpath]
+        if folder == 'symbols':
+            symbol_files[name] = new_index[fpath]['names']
+        else:
+            footprint_files[name] = new_index[fpath]['names']
+
+    if len(index_file) > 0 and (len(changed) > 0 or len(new_index) != len(index)):
+        try:
+            with open(index_file + '.tmp', 'w') as f:
+                json.dump({'version': LIBRARY_INDEX_VERSION, 
+                           'files': new_index}, f)
+            os.replace(index_file + '.tmp', index_file)
+        except OSError:
+            # The index only saves time, so a read-only library folder is not
+            # an error.
+            pass
 
     return symbol_files, footprint_files
 
 
-def fileValidator(symbol_files, footprint_files, categories, rows):
+def _readLibraryNames(job):
+    # Runs in a worker process, so it takes a single picklable argument.
+    fpath, marker = job
+    return list(dict.fromkeys(iterLibraryNames(fpath, marker)))
 
-    # We add the try/except clauses here so that if the row is partially complete
-    # we don't throw an index error and hang the sync.
-    
-    try:
-        symbol_path = rows[categories.field_index('library_path')].lower()
-    except IndexError:
-        symbol_path = ''
 
-    try:
-        footprint_path = rows[categories.field_index('footprint_path')].lower()
-    except IndexError:
-        footprint_path = ''
+def iterLibraryNames(fpath, marker):
+    # Yield the symbol (marker LibReference) or footprint (marker PATTERN)
+    # names in a SchLib or PcbLib.  The file is memory-mapped and only the
+    # streams that hold the records are read, so memory use does not grow
+    # with the size of the library.
+    if os.path.getsize(fpath) == 0:
+        return
 
-    try:
-        symbol = rows[categories.field_index('library_ref')]
-    except IndexError:
-        symbol = ''
+    record = re.compile(rb'\|(%UTF8%)?' + re.escape(marker.encode()) + 
+                        rb'=([^|\x00\r\n]*)')
 
-    try:
-        footprint = rows[categories.field_index('footprint_ref')]
-    except IndexError:
-        footprint = ''
+    with open(fpath, mode='rb') as lib_file:
+        with mmap.mmap(lib_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
 
+            streams = None
+            if CompoundFile.isCompoundFile(data):
+                try:
+                    library = CompoundFile(data)
+                    streams = [i for path, i in library.iterStreams() 
+                               if path[-1] == LIBRARY_RECORD_STREAMS[marker]]
+                except Exception:
+                    # Fall back to scanning the whole file below.
+                    streams = None
 
-    category = categories.name
-    component_id = rows[categories.field_index('component_id')]
+            if streams is None:
+                for m in record.finditer(data):
+                    yield _decodeLibraryName(m)
+                return
 
-    if symbol_path not in symbol_files:
-        if len(symbol_path) > 0:
-            print(colored('\n -> Warning: file "%s" not found in symbol folder. (%s:%s)' 
-                                % (symbol_path, category, component_id), 'yellow'), end='', flush=True)
-        else:
-            print(colored('\n -> Info: symbol path not specified. (%s:%s)' 
-                                % (category, component_id), 'blue'), end='', flush=True)
+            for i in streams:
+                matches = list(record.finditer(library.readStream(i)))
 
-    elif symbol not in symbol_files[symbol_path]:
-        print(colored('\n -> Warning: file "%s" does not contain the expected symbol "%s". (%s:%s)' 
-                        % (symbol_path, symbol, category, component_id), 'yellow'), end='', flush=True)
+                # Names that do not fit the ANSI code page are stored twice,
+                # once as UTF-8 and once with the characters replaced.
+                utf8 = [m for m in matches if m.group(1) is not None]
+                for m in (utf8 if len(utf8) > 0 else matches):
+                    yield _decodeLibraryName(m)
 
-    if footprint_path not in footprint_files:
-        if len(footprint_path) > 0:
-            print(colored('\n -> Warning: file "%s" not found in footprint folder. (%s:%s)' 
-                                % (footprint_path, category, component_id), 'yellow'), end='', flush=True)
-        else:
-            print(colored('\n -> Info: footprint path not specified. (%s:%s)' 
-                                % (category, component_id), 'blue'), end='', flush=True)
-        
-    elif footprint not in footprint_files[footprint_path]:
-        print(colored('\n -> Warning: file "%s" does not contain the expected footprint "%s". (%s:%s)' 
-                        % (footprint_path, footprint, category, component_id), 'yellow'), end='', flush=True)
-
-    # Do not update anything
-    return None, -1
\ No newline at end of file
+
+def _decodeLibraryName(match):
+    if match.group(1) is not None:
+        return match.group(2).decode('utf-8', 'replace')
+    return match.group(2).decode('cp1252', 'replace')
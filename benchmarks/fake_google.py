@@ -0,0 +1,230 @@
+# MIT License
+#
+# Copyright 2021 Jonathan Nutzmann
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Local stand-ins for the Google Sheets spreadsheets() and Drive files()
+# resources, serving a spreadsheet held in memory.  They answer the same
+# requests GSheetReader makes, apply writes back to the tabs so that repeated
+# syncs see the assigned Component IDs, and count every request.  An optional
+# per-request latency approximates the round trip to Google, and an error
+# rate makes a share of the requests fail with HTTP 429 like an exhausted
+# quota.
+
+import random
+import re
+import threading
+import time
+
+
+class FakeRequest:
+
+    def __init__(self, service, kind, response):
+        self._service = service
+        self._kind = kind
+        self._response = response
+
+    def execute(self, http=None, num_retries=0):
+        self._service.countRequest(self._kind)
+        if self._service.latency > 0:
+            time.sleep(self._service.latency)
+        if self._service.error_rate > 0 and \
+                self._service.random.random() < self._service.error_rate:
+            self._service.countRequest('rejected')
+            raise FakeHttpError(429)
+        return self._response()
+
+
+class FakeHttpError(Exception):
+
+    # Shaped like googleapiclient.errors.HttpError.
+
+    def __init__(self, status):
+        super().__init__('HTTP %i' % status)
+        self.resp = FakeResponse(status)
+        self.status_code = status
+
+
+class FakeResponse(dict):
+
+    # Shaped like httplib2.Response: the headers, plus the status.
+
+    def __init__(self, status):
+        super().__init__({'status': str(status)})
+        self.status = status
+
+
+
+
+class FakeSpreadsheets:
+
+    # A whole tab, a single cell ('Tab'!B7) or a span of rows ('Tab'!2:501).
+    RANGE = re.compile(r"^'((?:[^']|'')*)'(?:!([A-Z]+)([0-9]+)|!([0-9]+):([0-9]+)"
+                       r"|!([A-Z]+):([A-Z]+))?$")
+
+    def __init__(self, sheet_id, tabs, latency=0.0, error_rate=0.0, seed=0):
+        # tabs maps each tab name to its rows, header row first.
+        self.sheet_id = sheet_id
+        self.tabs = tabs
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.version = 1
+        self.requests = {}
+        self._lock = threading.Lock()
+
+    def countRequest(self, kind):
+        with self._lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+
+    def files(self):
+        return FakeFiles(self)
+
+    def values(self):
+        return FakeValues(self)
+
+    def get(self, spreadsheetId, fields=None, **kwargs):
+        self._checkId(spreadsheetId)
+        return FakeRequest(self, 'metadata', lambda: {
+            'sheets': [{
+                'properties': {
+                    'title': name,
+                    'gridProperties': {
+                        'rowCount': max(1000, len(rows)),
+                        'columnCount': max([26] + [len(r) for r in rows[:1]])
+                    }
+                }
+            } for name, rows in self.tabs.items()]
+        })
+
+    def readRange(self, range_name):
+        # Like the API, return a copy of the used rows, without trailing blank
+        # cells.
+        name, column, row = self._parseRange(range_name)
+        if row is None:
+            rows = self.tabs[name]
+        else:
+            rows = self.tabs[name][row[0] - 1:row[1]]
+        if column is not None:
+            # A span of whole columns.
+            rows = [r[column[0]:column[1] + 1] for r in rows]
+
+        # Blank rows at the end of the range are left out.
+        rows = [_trimRow(r) for r in rows]
+        while len(rows) > 0 and len(rows[-1]) == 0:
+            rows.pop()
+        return rows
+
+    def writeCell(self, range_name, value):
+        name, column, row = self._parseRange(range_name)
+        rows = self.tabs[name]
+        column_index = _columnIndex(column)
+
+        while len(rows) < row:
+            rows.append([])
+        cells = rows[row - 1]
+        if len(cells) <= column_index:
+            cells.extend([''] * (column_index + 1 - len(cells)))
+        cells[column_index] = value
+
+    def _parseRange(self, range_name):
+        m = FakeSpreadsheets.RANGE.match(range_name)
+        if m is None:
+            raise Exception('Unsupported range "%s".' % range_name)
+
+        name = m.group(1).replace("''", "'")
+        if name not in self.tabs:
+            raise Exception('Unable to parse range: %s' % range_name)
+
+        if m.group(4) is not None:
+            return name, None, (int(m.group(4)), int(m.group(5)))
+        if m.group(6) is not None:
+            return name, (_columnIndex(m.group(6)), _columnIndex(m.group(7))), None
+        if m.group(2) is None:
+            return name, None, None
+        return name, m.group(2), int(m.group(3))
+
+    def _checkId(self, spreadsheet_id):
+        if spreadsheet_id != self.sheet_id:
+            raise Exception('Requested entity was not found.')
+
+
+class FakeValues:
+
+    def __init__(self, sheets):
+        self._sheets = sheets
+
+    def get(self, spreadsheetId, range, **kwargs):
+        self._sheets._checkId(spreadsheetId)
+        return FakeRequest(self._sheets, 'read', lambda: {
+            'range': range,
+            'values': self._sheets.readRange(range)
+        })
+
+    def batchGet(self, spreadsheetId, ranges, **kwargs):
+        self._sheets._checkId(spreadsheetId)
+        return FakeRequest(self._sheets, 'read', lambda: {
+            'valueRanges': [{'range': r, 'values': self._sheets.readRange(r)} 
+                            for r in ranges]
+        })
+
+    def update(self, spreadsheetId, range, valueInputOption, body, **kwargs):
+        return self.batchUpdate(spreadsheetId, {
+            'valueInputOption': valueInputOption,
+            'data': [{'range': range, 'values': body['values']}]
+        })
+
+    def batchUpdate(self, spreadsheetId, body, **kwargs):
+        self._sheets._checkId(spreadsheetId)
+
+        def apply():
+            for d in body['data']:
+                self._sheets.writeCell(d['range'], d['values'][0][0])
+            # Every edit makes a new revision of the file.
+            self._sheets.version += 1
+            return {'totalUpdatedCells': len(body['data'])}
+
+        return FakeRequest(self._sheets, 'write', apply)
+
+
+class FakeFiles:
+
+    def __init__(self, sheets):
+        self._sheets = sheets
+
+    def get(self, fileId, fields=None, **kwargs):
+        self._sheets._checkId(fileId)
+        return FakeRequest(self._sheets, 'revision', 
+                           lambda: {'version': str(self._sheets.version)})
+
+
+def _trimRow(row):
+    end = len(row)
+    while end > 0 and row[end - 1] == '':
+        end -= 1
+    return list(row[:end])
+
+
+def _columnIndex(column_name):
+    index = 0
+    for c in column_name:
+        index = index * 26 + ord(c) - ord('A') + 1
+    return index - 1
@@ -0,0 +1,235 @@
+# MIT License
+#
+# Copyright 2021 Jonathan Nutzmann
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Synthetic Altium SchLib and PcbLib files for the benchmarks.  They are real
+# OLE compound files with one storage per symbol (footprint) holding the
+# record stream that getLibraryFiles reads names from, so library parsing is
+# measured on the same format it sees in practice.
+
+import os
+import random
+import struct
+
+from ..altium import LIBRARY_RECORD_STREAMS
+
+
+SECTOR_SIZE = 512
+MINI_SECTOR_SIZE = 64
+MINI_STREAM_CUTOFF = 4096
+
+FREESECT = 0xFFFFFFFF
+ENDOFCHAIN = 0xFFFFFFFE
+FATSECT = 0xFFFFFFFD
+NOSTREAM = 0xFFFFFFFF
+
+STORAGE = 1
+STREAM = 2
+ROOT = 5
+
+SCHLIB_HEADER = b'|HEADER=Protel for Windows - Schematic Library Editor Binary File Version 5.0'
+PCBLIB_HEADER = b'PCB 6.0 Binary Library File'
+
+
+def generateLibraries(library_dir, file_count=10, names_per_file=100, seed=0):
+    # Write file_count SchLibs into library_dir/symbols and as many PcbLibs
+    # into library_dir/footprints.  Returns the symbol and footprint names in
+    # each file, keyed by the lower case file name like getLibraryFiles.
+    rng = random.Random(seed)
+    symbol_files = {}
+    footprint_files = {}
+
+    for folder, extension, marker, files in [
+            ('symbols', 'SchLib', 'LibReference', symbol_files),
+            ('footprints', 'PcbLib', 'PATTERN', footprint_files)]:
+
+        os.makedirs(os.path.join(library_dir, folder), exist_ok=True)
+
+        for i in range(file_count):
+            filename = '%s%03i.%s' % (folder[:-1].capitalize(), i, extension)
+            names = ['%s_%03i_%04i_%s' % (marker[:3].upper(), i, n, 
+                                          rng.choice(['A', 'B', 'C', 'D']))
+                     for n in range(names_per_file)]
+
+            writeLibrary(os.path.join(library_dir, folder, filename), marker, 
+                         names, rng)
+            files[filename.lower()] = names
+
+    return symbol_files, footprint_files
+
+
+def writeLibrary(path, marker, names, rng):
+    stream_name = LIBRARY_RECORD_STREAMS[marker]
+
+    if marker == 'LibReference':
+        tree = {'FileHeader': _record(SCHLIB_HEADER + b'|WEIGHT=%i' % len(names))}
+    else:
+        tree = {'FileHeader': _record(PCBLIB_HEADER)}
+
+    for name in names:
+        # A few primitives after the name record, so streams are about the
+        # size of a simple real part.
+        records = [_record(b'|RECORD=1|%s=%s|PARTCOUNT=2|CURRENTPARTID=1' 
+                           % (marker.encode(), name.encode()))]
+        for _ in range(rng.randint(2, 20)):
+            records.append(_record(b'|RECORD=6|LOCATION.X=%i|LOCATION.Y=%i'
+                                   % (rng.randint(-500, 500), 
+                                      rng.randint(-500, 500))))
+
+        # Storage names are limited to 31 characters, the name record holds
+        # the full name.
+        tree[name[:31]] = {stream_name: b''.join(records)}
+
+    writeCompoundFile(path, tree)
+
+
+def _record(data):
+    data += b'\x00'
+    return struct.pack('<I', len(data)) + data
+
+
+def writeCompoundFile(path, tree):
+    # Write a version 3 compound file.  tree maps names to either bytes (a
+    # stream) or another dict (a storage).  Siblings are chained through
+    # their right pointers, which readers accept even though it is not a
+    # balanced tree.
+    entries = [{'name': 'Root Entry', 'type': ROOT}]
+
+    def addEntries(node):
+        children = []
+        for name in node:
+            index = len(entries)
+            entry = {'name': name}
+            entries.append(entry)
+            if isinstance(node[name], dict):
+                entry['type'] = STORAGE
+                entry['children'] = addEntries(node[name])
+            else:
+                entry['type'] = STREAM
+                entry['data'] = node[name]
+            children.append(index)
+        return children
+
+    entries[0]['children'] = addEntries(tree)
+
+    # Small streams are packed into the mini stream.
+    mini_stream = bytearray()
+    minifat = []
+    large_streams = []
+
+    for e in entries:
+        if e['type'] != STREAM:
+            continue
+        if len(e['data']) >= MINI_STREAM_CUTOFF:
+            large_streams.append(e)
+        elif len(e['data']) == 0:
+            e['start'] = ENDOFCHAIN
+        else:
+            e['start'] = len(mini_stream) // MINI_SECTOR_SIZE
+            count = _sectors(len(e['data']), MINI_SECTOR_SIZE)
+            minifat.extend(range(e['start'] + 1, e['start'] + count))
+            minifat.append(ENDOFCHAIN)
+            mini_stream += e['data'] + bytes(-len(e['data']) % MINI_SECTOR_SIZE)
+
+    directory_sectors = _sectors(len(entries) * 128, SECTOR_SIZE)
+    minifat_sectors = _sectors(len(minifat) * 4, SECTOR_SIZE)
+    mini_stream_sectors = _sectors(len(mini_stream), SECTOR_SIZE)
+    data_sectors = (directory_sectors + minifat_sectors + mini_stream_sectors +
+                    sum(_sectors(len(e['data']), SECTOR_SIZE) 
+                        for e in large_streams))
+
+    entries_per_sector = SECTOR_SIZE // 4
+    fat_sectors = 1
+    while fat_sectors * entries_per_sector < fat_sectors + data_sectors:
+        fat_sectors += 1
+    if fat_sectors > 109:
+        raise Exception('Compound file too large, DIFAT sectors are not '
+                        'supported.')
+
+    fat = [FATSECT] * fat_sectors
+
+    def allocate(count):
+        if count == 0:
+            return ENDOFCHAIN
+        start = len(fat)
+        fat.extend(range(start + 1, start + count))
+        fat.append(ENDOFCHAIN)
+        return start
+
+    directory_start = allocate(directory_sectors)
+    minifat_start = allocate(minifat_sectors)
+    entries[0]['start'] = allocate(mini_stream_sectors)
+    entries[0]['data'] = mini_stream
+    for e in large_streams:
+        e['start'] = allocate(_sectors(len(e['data']), SECTOR_SIZE))
+    fat.extend([FREESECT] * (fat_sectors * entries_per_sector - len(fat)))
+
+    for e in entries:
+        e['left'] = e['right'] = e['child'] = NOSTREAM
+    for e in entries:
+        children = e.get('children', [])
+        if len(children) > 0:
+            e['child'] = children[0]
+            for a, b in zip(children, children[1:]):
+                entries[a]['right'] = b
+
+    header = bytearray(SECTOR_SIZE)
+    header[:8] = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+    struct.pack_into('<HHHHH', header, 0x18, 0x3E, 3, 0xFFFE, 9, 6)
+    struct.pack_into('<IIIIIIIII', header, 0x28, 0, fat_sectors, 
+                     directory_start, 0, MINI_STREAM_CUTOFF, 
+                     minifat_start if len(minifat) > 0 else ENDOFCHAIN,
+                     minifat_sectors, ENDOFCHAIN, 0)
+    struct.pack_into('<109I', header, 0x4C, 
+                     *(list(range(fat_sectors)) + [FREESECT] * (109 - fat_sectors)))
+
+    directory = bytearray()
+    for e in entries:
+        entry = bytearray(128)
+        name = e['name'].encode('utf-16-le')[:62]
+        entry[:len(name)] = name
+        struct.pack_into('<HBB', entry, 64, len(name) + 2, e['type'], 1)
+        struct.pack_into('<III', entry, 68, e['left'], e['right'], e['child'])
+        data = e.get('data', b'')
+        struct.pack_into('<IQ', entry, 116, 
+                         e.get('start', ENDOFCHAIN) if e['type'] != STORAGE else 0,
+                         len(data))
+        directory += entry
+
+    minifat_data = struct.pack('<%iI' % len(minifat), *minifat)
+
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.write(struct.pack('<%iI' % len(fat), *fat))
+        f.write(_pad(directory))
+        f.write(_pad(minifat_data, b'\xff'))
+        f.write(_pad(mini_stream))
+        for e in large_streams:
+            f.write(_pad(e['data']))
+
+
+def _sectors(size, sector_size):
+    return (size + sector_size - 1) // sector_size
+
+
+def _pad(data, fill=b'\x00'):
+    return bytes(data) + fill * (-len(data) % SECTOR_SIZE)
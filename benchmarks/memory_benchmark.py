@@ -0,0 +1,131 @@
+# MIT License
+#
+# Copyright 2021 Jonathan Nutzmann
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+# Memory benchmark of the category rows.  Compares the rows as the Sheets
+# API returns them (lists of separate strings, decoded from JSON) with the
+# ColumnStore each Category keeps them in, for each library size:
+#
+#   python -m altium_gsheet_library.benchmarks.memory_benchmark \
+#       --sizes 10000,50000,200000 --output memory.json
+#
+# Memory is measured with tracemalloc, so it only counts Python objects.
+
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from ..column_store import ColumnStore
+from .synthetic_sheet import generateSheet
+
+
+def measure(function):
+    # Returns (result, bytes still allocated by it, seconds).
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size, seconds
+
+
+def buildStores(sheet):
+    return dict((c, ColumnStore(sheet[c][1:])) for c in sheet)
+
+
+def runSize(size, args):
+    rows = max(1, size // args.categories)
+    sheet = generateSheet(args.categories, rows, args.columns, seed=args.seed)
+    encoded = json.dumps(sheet)
+    del sheet
+
+    # What readAndValidateCategories used to keep for the whole sync.
+    lists, list_bytes, list_seconds = measure(lambda: json.loads(encoded))
+
+    # Decoded again, so that the strings the stores keep are counted, while
+    # the decoded lists are freed once the stores are built.
+    stores, store_bytes, store_seconds = measure(
+        lambda: buildStores(json.loads(encoded)))
+    del lists
+
+    start = time.perf_counter()
+    cells = sum(len(r) for c in stores for r in stores[c])
+    iterate_seconds = time.perf_counter() - start
+
+    return {
+        'size': rows * args.categories,
+        'cells': cells,
+        'list_bytes': list_bytes,
+        'store_bytes': store_bytes,
+        'ratio': list_bytes / max(1, store_bytes),
+        'decode_seconds': list_seconds,
+        'build_seconds': store_seconds - list_seconds,
+        'iterate_seconds': iterate_seconds
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare the memory used by the category rows.')
+
+    parser.add_argument('--sizes', default='10000,50000,200000',
+                        help='Comma separated numbers of components.')
+    parser.add_argument('--categories', type=int, default=20,
+                        help='Number of category tabs.')
+    parser.add_argument('--columns', type=int, default=16,
+                        help='Number of columns in every category.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    args = parser.parse_args()
+
+    print('%8s %10s %10s %6s %8s %8s %8s' % ('size', 'lists MB', 'store MB', 
+          'ratio', 'decode', 'build', 'iterate'))
+
+    results = []
+    for size in [int(s) for s in args.sizes.split(',')]:
+        r = runSize(size, args)
+        results.append(r)
+        print('%8i %10.1f %10.1f %6.1f %8.2f %8.2f %8.2f' % (r['size'], 
+              r['list_bytes'] / 1e6, r['store_bytes'] / 1e6, r['ratio'],
+              r['decode_seconds'], r['build_seconds'], r['iterate_seconds']),
+              flush=True)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': sys.version,
+                'platform': platform.platform(),
+                'arguments': vars(args),
+                'results': results
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+# MIT License
+#
+# Copyright 2021 Jonathan Nutzmann
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# End-to-end sync benchmark.  Runs runSync against a synthetic spreadsheet
+# served by FakeSpreadsheets, a SQLite database and synthetic SchLib/PcbLib
+# files, and reports how long each phase of the sync takes (as recorded in
+# its SyncMetrics) for each library size:
+#
+#   python -m altium_gsheet_library.benchmarks.sync_benchmark \
+#       --sizes 1000,10000,50000,200000 --output results.json
+#
+# Each size is synced --runs times against the same sheet and database: the
+# first run assigns the missing Component IDs and reads every library, the
+# following runs show the steady state.
+
+import argparse
+import configparser
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from .. import sync
+from ..database import LibraryDatabase
+from ..gsheet import GSheetReader, MultiSheetReader
+from ..populators import BatchPopulator
+from ..sync_config import SyncConfig
+from .fake_google import FakeSpreadsheets
+from .library_fixtures import generateLibraries
+from .synthetic_sheet import generateSheet
+
+
+SHEET_ID = 'benchmark'
+
+PHASES = ['read', 'populate', 'schema', 'load', 'swap', 'validate', 'dblib', 
+          'cache', 'snapshot']
+
+
+class LookupPopulator(BatchPopulator):
+
+    # Stands in for a distributor lookup: every batch waits latency seconds
+    # and returns a lifecycle status per part number.
+
+    input_fields = ['Manufacturer Part Number']
+    output_field = 'Parameter 0'
+
+    def __init__(self, latency, batch_size, max_workers):
+        self.latency = latency
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+
+    def populate(self, category, columns):
+        time.sleep(self.latency)
+        return ['Active' if int(mpn[-1]) % 4 else 'NRND' 
+                for mpn in columns['Manufacturer Part Number']]
+
+
+def makeConfig(work_dir, args):
+    config = configparser.ConfigParser()
+    config.read_dict({
+        'database': {
+            'backend': 'sqlite',
+            'path': ':memory:' if args.memory else 
+                    os.path.join(work_dir, 'library.sqlite'),
+            'sync_mode': args.sync_mode,
+            'insert_batch_size': str(args.insert_batch_size),
+            'indexed_fields': '["Manufacturer Part Number"]',
+            'search_fields': '["Manufacturer"]'
+        },
+        'gsheet': {
+            'sheet_id': json.dumps(sheetIds(args)) if args.spreadsheets > 1 
+                        else SHEET_ID,
+            'secret_file': 'unused',
+            'custom_required_fields': '["Manufacturer", "Manufacturer Part Number"]',
+            'cache_file': os.path.join(work_dir, 'sheet_cache.json') 
+                          if args.cache else '',
+            'batch_read': str(args.batch_read).lower(),
+            'stream_window': str(args.stream_window),
+            'read_workers': str(args.read_workers),
+            'read_requests_per_minute': str(args.requests_per_minute),
+            'write_requests_per_minute': str(args.requests_per_minute),
+            'retry_backoff': '0.1'
+        },
+        'altium': {
+            'dblib_file': os.path.join(work_dir, 'library', 'library.DbLib'),
+            'library_workers': str(args.library_workers),
+            'validation_report': ''
+        },
+        'snapshots': {
+            'directory': os.path.join(work_dir, 'snapshots') 
+                         if args.snapshots else ''
+        }
+    })
+
+    text = io.StringIO()
+    config.write(text)
+    text.seek(0)
+    text.name = 'benchmark.ini'
+
+    return SyncConfig(text)
+
+
+def runSize(size, args, work_dir, symbol_files, footprint_files):
+    rows = max(1, size // args.categories)
+    tabs = generateSheet(args.categories, rows, args.columns, symbol_files,
+                         footprint_files, args.new_fraction, 
+                         args.missing_fraction, args.seed)
+    # The tabs are dealt out over the spreadsheets.
+    names = list(tabs)
+    spreadsheets = dict((sheet_id, FakeSpreadsheets(sheet_id, 
+        dict((n, tabs[n]) for n in names[i::len(sheetIds(args))]), 
+        args.latency, args.error_rate, args.seed + i)) 
+        for i, sheet_id in enumerate(sheetIds(args)))
+
+    sync_config = makeConfig(work_dir, args)
+    db = LibraryDatabase(sync_config.get('database'))
+
+    populators = []
+    if args.populator_latency is not None:
+        populators.append(LookupPopulator(args.populator_latency, 
+            args.populator_batch_size, args.populator_workers))
+
+    results = []
+
+    try:
+        for run in range(args.runs):
+            for sheets in spreadsheets.values():
+                sheets.requests = {}
+            if args.spreadsheets > 1:
+                gsReader = MultiSheetReader(sync_config.get('gsheet'), 
+                    sheets=spreadsheets, files=dict((i, spreadsheets[i].files()) 
+                                                    for i in spreadsheets))
+            else:
+                sheets = spreadsheets[SHEET_ID]
+                gsReader = GSheetReader(sync_config.get('gsheet'), 
+                                        sheets=sheets, files=sheets.files())
+
+            with open(os.devnull, 'w') as devnull:
+                with contextlib.redirect_stdout(devnull):
+                    sync.runSync(sync_config, db, gsReader, populators, 
+                                 force=True)
+
+            metrics = db.metrics
+            phases = dict((p, metrics.phases.get(p, 0.0)) for p in PHASES)
+            phases['other'] = max(0.0, metrics.duration - sum(phases.values()))
+
+            results.append({
+                'size': rows * args.categories,
+                'run': run + 1,
+                'total': metrics.duration,
+                'components_per_second': rows * args.categories / metrics.duration,
+                'phases': phases,
+                'counters': metrics.counters,
+                'requests': sumRequests(spreadsheets.values())
+            })
+            printResult(results[-1])
+
+            # Libraries only need parsing again if they changed.
+            if not args.library_index:
+                os.remove(os.path.join(work_dir, 'library', 
+                                       '.library_index.json'))
+    finally:
+        db.close()
+        if not args.memory:
+            os.remove(os.path.join(work_dir, 'library.sqlite'))
+
+    return results
+
+
+def sheetIds(args):
+    if args.spreadsheets > 1:
+        return ['%s-%i' % (SHEET_ID, i) for i in range(args.spreadsheets)]
+    return [SHEET_ID]
+
+
+def sumRequests(spreadsheets):
+    requests = {}
+    for sheets in spreadsheets:
+        for kind in sheets.requests:
+            requests[kind] = requests.get(kind, 0) + sheets.requests[kind]
+    return requests
+
+
+def printHeader():
+    print('%8s %4s %8s %9s ' % ('size', 'run', 'total', 'parts/s') + 
+          ' '.join('%8s' % p for p in PHASES + ['other']))
+
+
+def printResult(result):
+    print('%8i %4i %8.2f %9.0f ' % (result['size'], result['run'], 
+          result['total'], result['components_per_second']) +
+          ' '.join('%8.2f' % result['phases'][p] for p in PHASES + ['other']),
+          flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the sync against synthetic data.')
+
+    parser.add_argument('--sizes', default='1000,10000,50000,200000',
+                        help='Comma separated numbers of components.')
+    parser.add_argument('--categories', type=int, default=20,
+                        help='Number of category tabs.')
+    parser.add_argument('--columns', type=int, default=16,
+                        help='Number of columns in every category.')
+    parser.add_argument('--runs', type=int, default=2,
+                        help='Syncs per size.')
+    parser.add_argument('--sync-mode', default='recreate',
+                        choices=LibraryDatabase.SYNC_MODES)
+    parser.add_argument('--insert-batch-size', type=int, default=1000)
+    parser.add_argument('--new-fraction', type=float, default=0.01,
+                        help='Fraction of rows without a Component ID.')
+    parser.add_argument('--missing-fraction', type=float, default=0.01,
+                        help='Fraction of rows with a missing symbol or '
+                             'footprint.')
+    parser.add_argument('--library-files', type=int, default=20,
+                        help='Number of SchLib and of PcbLib files.')
+    parser.add_argument('--library-names', type=int, default=200,
+                        help='Symbols (footprints) in each library file.')
+    parser.add_argument('--library-workers', type=int, default=os.cpu_count())
+    parser.add_argument('--no-library-index', dest='library_index', 
+                        action='store_false',
+                        help='Parse every library on every run.')
+    parser.add_argument('--cache', action='store_true',
+                        help='Use the sheet cache between runs.')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds added to every Google API request.')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fraction of Google API requests rejected with '
+                             'HTTP 429.')
+    parser.add_argument('--no-batch-read', dest='batch_read', 
+                        action='store_false',
+                        help='Read every tab with its own request.')
+    parser.add_argument('--spreadsheets', type=int, default=1,
+                        help='Split the tabs over this many spreadsheets.')
+    parser.add_argument('--snapshots', action='store_true',
+                        help='Save a snapshot of the library after every run.')
+    parser.add_argument('--stream-window', type=int, default=0,
+                        help='Stream the tabs this many rows at a time.')
+    parser.add_argument('--read-workers', type=int, default=4,
+                        help='Sheets requests in flight at the same time.')
+    parser.add_argument('--requests-per-minute', type=float, default=600,
+                        help='Sheets read and write quota.')
+    parser.add_argument('--populator-latency', type=float,
+                        help='Run a batch populator that takes this many '
+                             'seconds per batch.')
+    parser.add_argument('--populator-batch-size', type=int, default=100)
+    parser.add_argument('--populator-workers', type=int, default=4)
+    parser.add_argument('--memory', action='store_true',
+                        help='Use an in-memory SQLite database.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='library_benchmark_')
+
+    try:
+        symbol_files, footprint_files = generateLibraries(
+            os.path.join(work_dir, 'library'), args.library_files, 
+            args.library_names, args.seed)
+
+        printHeader()
+        results = []
+        for size in [int(s) for s in args.sizes.split(',')]:
+            results += runSize(size, args, work_dir, symbol_files, 
+                               footprint_files)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': sys.version,
+                'platform': platform.platform(),
+                'sqlite': sqlite3.sqlite_version,
+                'arguments': vars(args),
+                'results': results
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# MIT License
+#
+# Copyright 2021 Jonathan Nutzmann
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Generator for synthetic library spreadsheets: any number of category tabs,
+# rows and columns, filled with values shaped like a real library (repeated
+# manufacturers and footprints, unique part numbers, UUID Component IDs).
+# The same seed always produces the same sheet.
+
+import random
+import uuid
+
+
+BASE_HEADER = ['Component ID', 'Description*', 'Library Ref', 'Library Path',
+               'Footprint Ref', 'Footprint Path', 'Manufacturer', 
+               'Manufacturer Part Number', 'Datasheet^']
+
+MANUFACTURERS = ['Analog Devices', 'Texas Instruments', 'Murata', 'Yageo', 
+                 'Vishay', 'TDK', 'Microchip', 'STMicroelectronics', 'Panasonic',
+                 'KEMET', 'Samsung Electro-Mechanics', 'Infineon', 'onsemi',
+                 'Nexperia', 'Wurth Elektronik', 'Molex']
+
+VALUES = ['10', '22', '47', '100', '220', '470', '1k', '2.2k', '4.7k', '10k', 
+          '22k', '47k', '100k', '1M']
+
+
+def generateSheet(category_count, row_count, column_count=len(BASE_HEADER), 
+                  symbol_files={}, footprint_files={}, new_fraction=0.0, 
+                  missing_fraction=0.0, seed=0):
+    # Returns {tab name: rows} with the header row first, for
+    # category_count categories of row_count rows each.  new_fraction of the
+    # rows have no Component ID yet, and missing_fraction refer to a symbol
+    # or footprint that is not in the libraries.
+    rng = random.Random(seed)
+
+    symbols = [(f, n) for f in sorted(symbol_files) for n in symbol_files[f]]
+    footprints = [(f, n) for f in sorted(footprint_files) 
+                  for n in footprint_files[f]]
+    if len(symbols) == 0:
+        symbols = [('symbols.schlib', 'SYMBOL')]
+    if len(footprints) == 0:
+        footprints = [('footprints.pcblib', 'FOOTPRINT')]
+
+    extra_columns = max(0, column_count - len(BASE_HEADER))
+    header = BASE_HEADER + ['Parameter %i' % i for i in range(extra_columns)]
+
+    tabs = {}
+
+    for c in range(category_count):
+        name = 'Category %03i' % c
+        rows = [list(header)]
+
+        # Parts in a category share a handful of symbols and footprints.
+        category_symbols = rng.sample(symbols, min(len(symbols), 8))
+        category_footprints = rng.sample(footprints, min(len(footprints), 8))
+
+        for r in range(row_count):
+            if rng.random() < new_fraction:
+                component_id = ''
+            else:
+                component_id = str(uuid.UUID(int=rng.getrandbits(128), 
+                                             version=4))
+
+            symbol_file, symbol = rng.choice(category_symbols)
+            footprint_file, footprint = rng.choice(category_footprints)
+            if rng.random() < missing_fraction:
+                if rng.random() < 0.5:
+                    symbol = symbol[:-1] + 'X'
+                else:
+                    footprint_file = footprint_file.replace('0', 'O', 1)
+
+            manufacturer = rng.choice(MANUFACTURERS)
+            part_number = '%s-%06i' % (manufacturer[:3].upper(), 
+                                       rng.randrange(1000000))
+            value = rng.choice(VALUES)
+
+            row = [component_id, 
+                   '%s %s %s' % (name, value, footprint),
+                   symbol, symbol_file, footprint, footprint_file,
+                   manufacturer, part_number,
+                   'https://example.com/datasheets/%s.pdf' % part_number]
+
+            for i in range(extra_columns):
+                # Mostly short repeated values, like package or tolerance 
+                # columns, with the occasional blank cell.
+                if rng.random() < 0.1:
+                    row.append('')
+                else:
+                    row.append('%s %i' % (value, rng.randrange(8)))
+
+            # The API leaves off trailing blank cells.
+            while len(row) > 0 and row[-1] == '':
+                row.pop()
+            rows.append(row)
+
+        tabs[name] = rows
+
+    return tabs
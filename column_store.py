@@ -0,0 +1,169 @@
+# MIT License
+#
+# Copyright 2021 Jonathan Nutzmann
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+from array import array
+from itertools import chain, compress
+from operator import itemgetter
+
+
+class ColumnStore:
+
+    # The rows of a category, kept column by column.  Each column is an array
+    # of small integer codes into the list of distinct values seen in it, so
+    # the footprint paths, manufacturers and other values repeated down a
+    # category are only stored once, and a cell costs one to four bytes
+    # instead of a pointer to its own string.
+    #
+    # It reads like the list of rows returned by the Sheets API: rows are
+    # lists of strings that stop at their last non-empty cell.  Rows are
+    # decoded when they are read, so changes must go through set().  Cells
+    # past the end of a row always hold code 0, the empty string.
+
+    __slots__ = ('_lengths', '_columns', '_values')
+
+    # Rows decoded at a time when iterating.
+    CHUNK_SIZE = 1024
+
+    def __init__(self, rows=[]):
+        if not isinstance(rows, list):
+            rows = list(rows)
+
+        # Length of each row, so rows come back exactly as they went in.
+        self._lengths = array('I', [len(r) for r in rows])
+        self._columns = []
+        self._values = []
+
+        # Padding the short rows and then reading whole columns with the
+        # builtins keeps the per cell work out of Python code.
+        width = max(self._lengths, default=0)
+        rows = [r if len(r) == width else r + [''] * (width - len(r)) 
+                for r in rows]
+        for j in range(width):
+            self._addColumn(list(map(itemgetter(j), rows)))
+
+    @staticmethod
+    def fromColumns(columns):
+        # A store of full width rows from a list of equally long columns.
+        store = ColumnStore()
+        row_count = len(columns[0]) if len(columns) > 0 else 0
+        store._lengths = array('I', [len(columns)]) * row_count
+        for column in columns:
+            store._addColumn(column)
+        return store
+
+    def _addColumn(self, column):
+        # Code 0 is always the empty cell, so short rows and new columns can
+        # be filled with zeros.
+        values = list(dict.fromkeys(chain(('',), column)))
+        codes = dict(zip(values, range(len(values))))
+        self._columns.append(array(_typecode(len(values)), 
+                                   map(codes.__getitem__, column)))
+        self._values.append(values)
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        return [self._values[j][self._columns[j][index]] 
+                for j in range(self._lengths[index])]
+
+    def __iter__(self):
+        # Decode a chunk of rows a column at a time, which is much faster
+        # than cell by cell.
+        for start in range(0, len(self), ColumnStore.CHUNK_SIZE):
+            end = min(start + ColumnStore.CHUNK_SIZE, len(self))
+            lengths = self._lengths[start:end]
+            width = max(lengths, default=0)
+            columns = [[values[c] for c in codes[start:end]] for values, codes
+                       in zip(self._values[:width], self._columns[:width])]
+
+            for length, row in zip(lengths, zip(*columns) if width > 0 
+                                   else [()] * len(lengths)):
+                yield list(row) if length == width else list(row[:length])
+
+    def rowLength(self, row_index):
+        return self._lengths[row_index]
+
+    def nonEmptyRows(self):
+        # Indexes of the rows with at least one cell.
+        return list(compress(range(len(self._lengths)), self._lengths))
+
+    def cell(self, row_index, column_index):
+        # Cells past the end of a row are blank.
+        if column_index < 0 or column_index >= len(self._columns):
+            return ''
+        return self._values[column_index][self._columns[column_index][row_index]]
+
+    def column(self, column_index, row_indexes=None):
+        # The values of one column, for all rows or the given ones.
+        if column_index < 0 or column_index >= len(self._columns):
+            return [''] * (len(self) if row_indexes is None else len(row_indexes))
+
+        values = self._values[column_index]
+        codes = self._columns[column_index]
+        if row_indexes is None:
+            return list(map(values.__getitem__, codes))
+        return [values[codes[i]] for i in row_indexes]
+
+    def distinctValues(self, column_index):
+        # The values used in a column, each once.
+        if column_index < 0 or column_index >= len(self._columns):
+            return []
+        values = self._values[column_index]
+        return [values[c] for c in set(self._columns[column_index])]
+
+    def set(self, row_index, column_index, value):
+        # Set a cell, extending the row (and the store) if needed.  The value
+        # is not looked up among the existing ones, which keeps updates cheap
+        # at the cost of a few duplicates; stores are rebuilt on every sync.
+        while column_index >= len(self._columns):
+            self._columns.append(array('B', bytes(len(self))))
+            self._values.append([''])
+
+        values = self._values[column_index]
+        if value == '':
+            code = 0
+        else:
+            code = len(values)
+            values.append(value)
+
+        codes = self._columns[column_index]
+        if code >= 1 << (8 * codes.itemsize):
+            codes = self._columns[column_index] = array(_typecode(code + 1), codes)
+        codes[row_index] = code
+
+        if column_index >= self._lengths[row_index]:
+            self._lengths[row_index] = column_index + 1
+
+
+def _typecode(count):
+    # Smallest unsigned array type that holds codes 0 to count - 1.
+    if count <= 1 << 8:
+        return 'B'
+    elif count <= 1 << 16:
+        return 'H'
+    return 'I'
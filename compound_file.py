@@ -0,0 +1,191 @@
+# MIT License
+#
+# Copyright 2021 Jonathan Nutzmann
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Minimal read-only reader for OLE compound documents ([MS-CFB]), the
+# container format of Altium SchLib and PcbLib files.  The file is expected
+# to be memory-mapped: only the allocation tables and directory are decoded
+# up front, and a stream's sectors are only touched when it is read.
+
+from array import array
+import struct
+import sys
+
+
+class CompoundFile:
+
+    SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+
+    NOSTREAM = 0xFFFFFFFF
+
+    STORAGE = 1
+    STREAM = 2
+    ROOT = 5
+
+    def __init__(self, data):
+        # data is any bytes-like object, normally an mmap of the file.
+        if not CompoundFile.isCompoundFile(data):
+            raise Exception('Not a compound file.')
+
+        self._data = data
+
+        (major_version, byte_order, sector_shift, mini_sector_shift) = \
+            struct.unpack_from('<HHHH', data, 0x1A)
+        (fat_sector_count, first_dir_sector) = struct.unpack_from('<II', data, 0x2C)
+        (self._mini_cutoff, first_minifat_sector, minifat_sector_count,
+         first_difat_sector, difat_sector_count) = \
+            struct.unpack_from('<IIIII', data, 0x38)
+
+        self._major_version = major_version
+        self._sector_size = 1 << sector_shift
+        self._mini_sector_size = 1 << mini_sector_shift
+        self._sector_count = (len(data) - self._sector_size) // self._sector_size
+
+        # The first 109 FAT sector locations live in the header, the rest in
+        # a chain of DIFAT sectors.
+        fat_sectors = self._uint32s(0x4C, 109)
+        entries_per_sector = self._sector_size // 4
+        sector = first_difat_sector
+        for _ in range(difat_sector_count):
+            if sector >= self._sector_count:
+                break
+            difat = self._uint32s(self._sectorOffset(sector), entries_per_sector)
+            fat_sectors.extend(difat[:-1])
+            sector = difat[-1]
+
+        self._fat = array('I')
+        for s in fat_sectors[:fat_sector_count]:
+            self._fat.extend(self._uint32s(self._sectorOffset(s), entries_per_sector))
+
+        self._minifat = array('I')
+        for s in self._chain(first_minifat_sector, self._fat):
+            self._minifat.extend(self._uint32s(self._sectorOffset(s), entries_per_sector))
+
+        self._entries = []
+        for s in self._chain(first_dir_sector, self._fat):
+            offset = self._sectorOffset(s)
+            for i in range(self._sector_size // 128):
+                self._entries.append(self._readEntry(offset + i * 128))
+
+        self._mini_stream_sectors = None
+
+    @staticmethod
+    def isCompoundFile(data):
+        return len(data) >= 512 and data[:8] == CompoundFile.SIGNATURE
+
+    def iterStreams(self):
+        # Yield (path, entry index) for every stream, where path is a tuple of
+        # the storage names leading to it followed by the stream name.
+        if len(self._entries) == 0:
+            return
+
+        stack = [(self._entries[0]['child'], ())]
+        visited = set()
+
+        while len(stack) > 0:
+            index, parent = stack.pop()
+            if index == CompoundFile.NOSTREAM or index >= len(self._entries):
+                continue
+            if index in visited:
+                # Corrupt directories can contain loops.
+                continue
+            visited.add(index)
+
+            entry = self._entries[index]
+            stack.append((entry['left'], parent))
+            stack.append((entry['right'], parent))
+
+            path = parent + (entry['name'],)
+            if entry['type'] == CompoundFile.STREAM:
+                yield path, index
+            elif entry['type'] == CompoundFile.STORAGE:
+                stack.append((entry['child'], path))
+
+    def readStream(self, index):
+        entry = self._entries[index]
+
+        if entry['size'] < self._mini_cutoff:
+            if self._mini_stream_sectors is None:
+                # Small streams are packed into 64 byte mini sectors inside
+                # the root entry's stream.  Only remember which regular
+                # sectors hold it, instead of copying it out.
+                self._mini_stream_sectors = array('I', 
+                    self._chain(self._entries[0]['start'], self._fat))
+            return self._readChain(entry['start'], entry['size'], self._minifat,
+                                   self._mini_sector_size, self._miniSectorOffset)
+
+        return self._readChain(entry['start'], entry['size'], self._fat,
+                               self._sector_size, self._sectorOffset)
+
+    def _readChain(self, start, size, fat, sector_size, offset):
+        parts = []
+        remaining = size
+
+        for s in self._chain(start, fat):
+            if remaining <= 0:
+                break
+            o = offset(s)
+            parts.append(self._data[o:o + min(sector_size, remaining)])
+            remaining -= sector_size
+
+        return b''.join(parts)
+
+    def _chain(self, start, fat):
+        # Follow a sector chain.  The special end of chain and free sector
+        # markers are all larger than any table, and a chain can never be
+        # longer than its table, which also stops loops in corrupt files.
+        sector = start
+        for _ in range(len(fat)):
+            if sector >= len(fat):
+                break
+            yield sector
+            sector = fat[sector]
+
+    def _miniSectorOffset(self, mini_sector):
+        position = mini_sector * self._mini_sector_size
+        sector = self._mini_stream_sectors[position // self._sector_size]
+        return self._sectorOffset(sector) + position % self._sector_size
+
+    def _readEntry(self, offset):
+        name_length, entry_type = struct.unpack_from('<HB', self._data, offset + 64)
+        left, right, child = struct.unpack_from('<III', self._data, offset + 68)
+        start, size = struct.unpack_from('<IQ', self._data, offset + 116)
+
+        if self._major_version == 3:
+            # Version 3 files only use the low 32 bits of the size.
+            size &= 0xFFFFFFFF
+
+        name_length = max(0, min(name_length, 64) - 2)
+        name = bytes(self._data[offset:offset + name_length]).decode('utf-16-le', 'replace')
+
+        return {'name': name, 'type': entry_type, 'left': left, 'right': right,
+                'child': child, 'start': start, 'size': size}
+
+    def _sectorOffset(self, sector):
+        return (sector + 1) * self._sector_size
+
+    def _uint32s(self, offset, count):
+        values = array('I')
+        values.frombytes(bytes(self._data[offset:offset + count * 4]))
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return values
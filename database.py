@@ -21,47 +21,570 @@
 # SOFTWARE.
 
 
-import mariadb
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+from termcolor import colored
+
+try:
+    import mariadb
+except ImportError:
+    # Only needed by the MariaDB backend.
+    mariadb = None
+
+from .instrumentation import SyncMetrics
+from .models import INDEX_KEYWORDS, SearchCategory, column_width
 
 
 class LibraryDatabase:
 
+    SYNC_MODES = ['recreate', 'incremental', 'shadow']
+
+    # Table name prefixes used while building and retiring tables in shadow
+    # mode.  Altium only reads the tables listed in the DbLib, so these never
+    # show up in the library.
+    STAGING_PREFIX = '_new_'
+    RETIRED_PREFIX = '_old_'
+
     def __init__(self, database_config):
 
         self._config = database_config
+        self._backend = getBackend(database_config)
+        self.metrics = SyncMetrics()
+        self._connect()
 
-        try:
-            self._conn = mariadb.connect(
-                user=database_config['user'],
-                password=database_config['password'],
-                host=database_config['host'],
-                port=int(database_config['port']),
-                database=database_config['database']
-            )
-        except mariadb.Error as e:
-            raise Exception("Error connecting to specified database.")
+        # With a pool, every worker thread loading a category gets its own
+        # pooled connection, so separate tables can load at the same time.
+        # Backends without a pool load one category at a time.  The search
+        # table loads on the main connection and has to commit in the same
+        # transaction as the categories, so with a search table they all
+        # load on the main connection too, and pool_size only sets how many
+        # categories are populated at once.
+        self.pool_size = database_config.getint('pool_size', fallback=1)
+        self.search_table = database_config.get('search_table', 'all_components')
+        self.load_workers = self.pool_size
+        if len(self.search_table) > 0:
+            self.load_workers = 1
+        self._pool = None
+        if self.load_workers > 1:
+            self._pool = self._backend.createPool(self.load_workers)
+            if self._pool is None:
+                self.pool_size = self.load_workers = 1
+
+        self._local = threading.local()
+        self._leased = []
+        self._lock = threading.Lock()
+
+        self._insert_batch_size = database_config.getint('insert_batch_size',
+                                                         fallback=1000)
+        self._bulk_load_threshold = database_config.getint(
+                                        'bulk_load_threshold', fallback=20000)
+        if not self._backend.supports_bulk_load:
+            self._bulk_load_threshold = 0
+        self.indexed_fields = json.loads(database_config.get('indexed_fields', 
+                                                             '[]'))
+        self.search_fields = json.loads(database_config.get('search_fields', '[]'))
+        self.sync_mode = database_config.get('sync_mode', 'recreate')
+        if self.sync_mode not in LibraryDatabase.SYNC_MODES:
+            raise Exception('Unknown sync_mode "%s" in database config.' 
+                            % self.sync_mode)
+
+        self.resetStats()
+
+    def _connect(self):
+        self._conn = self._backend.connect()
 
         # Get Cursor
-        self._cursor = self._conn.cursor()
+        self._main_cursor = CountingCursor(self._conn.cursor(), self)
+
+    @property
+    def _cursor(self):
+        # The main thread uses the main connection.  Worker threads lease a
+        # connection from the pool the first time they need one and keep it
+        # until releaseConnections.
+        if self._pool is None or threading.current_thread() is threading.main_thread():
+            return self._main_cursor
+
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            conn = self._pool.get_connection()
+            with self._lock:
+                self._leased.append(conn)
+            cursor = self._local.cursor = CountingCursor(conn.cursor(), self)
+        return cursor
+
+    def releaseConnections(self):
+        # Return the connections leased by worker threads to the pool.  Only
+        # call this once the workers are done.
+        with self._lock:
+            for conn in self._leased:
+                conn.close()
+            self._leased = []
+        self._local = threading.local()
+
+    def ping(self):
+        # Check that a long lived connection is still up, and reconnect if
+        # the server dropped it.
+        if not self._backend.ping(self._conn):
+            try:
+                self._conn.close()
+            except self._backend.Error:
+                pass
+            self._connect()
+
+    def resetStats(self):
+        self.rows_loaded = 0
+        self.rows_inserted = 0
+        self.rows_updated = 0
+        self.rows_deleted = 0
+        self.load_seconds = 0.0
 
     def commit(self):
+        # Commit the work of every worker thread along with the main
+        # connection, so the whole load becomes visible together.
+        for conn in self._leased:
+            conn.commit()
         self._conn.commit()
+        self.releaseConnections()
+
+    def rollback(self):
+        for conn in [self._conn] + self._leased:
+            try:
+                conn.rollback()
+            except self._backend.Error:
+                pass
+        self.releaseConnections()
 
     def execute(self, query):
         return self._cursor.execute(query)
 
+    def insertRows(self, table, columns, rows):
+        # Insert rows into a single table using bound parameters, sending
+        # insert_batch_size rows per executemany call.
+        start = time.perf_counter()
+
+        count = self._insert(table, columns, 
+                             [padRow(r, len(columns)) for r in rows])
+
+        self._addStats(start, inserted=count)
+
+        return count
+
+    def _insert(self, table, columns, rows):
+        # Large tables go through LOAD DATA, everything else through batched
+        # INSERT statements.
+        if 0 < self._bulk_load_threshold <= len(rows):
+            try:
+                return self.bulkLoadRows(table, columns, rows)
+            except self._backend.Error as e:
+                # Most likely local_infile is disabled on the server.  Fall
+                # back to INSERT for the rest of this session.
+                print(colored('\n -> Warning: LOAD DATA LOCAL INFILE failed (%s), '
+                              'using INSERT instead.' % e, 'yellow'), 
+                      end='', flush=True)
+                self._bulk_load_threshold = 0
+
+        return self._executeBatches('INSERT INTO %s (%s) VALUES (%s)' % (
+            quoteIdentifier(table),
+            ','.join(quoteIdentifier(c) for c in columns),
+            ','.join(['?'] * len(columns))), rows)
+
+    def bulkLoadRows(self, table, columns, rows):
+        # Rows must already be padded to the number of columns.
+        count = self._backend.bulkLoadRows(self._cursor, table, columns, rows)
+        self.metrics.count('sql_bulk_rows', count)
+        return count
+
+    def syncRows(self, table, columns, rows):
+        # Bring an existing table in line with rows by comparing them with the
+        # current contents by component_id, and only inserting, updating and
+        # deleting the rows that differ.
+        start = time.perf_counter()
+
+        key_index = columns.index('component_id')
+        quoted_columns = [quoteIdentifier(c) for c in columns]
+
+        self._cursor.execute('SELECT %s FROM %s' % (','.join(quoted_columns),
+                                                   quoteIdentifier(table)))
+        current = {}
+        for r in self._cursor.fetchall():
+            current[r[key_index]] = tuple(r)
+
+        inserts = []
+        updates = []
+        incoming = set()
+
+        for r in rows:
+            r = padRow(r, len(columns))
+            component_id = r[key_index]
+            incoming.add(component_id)
+
+            if component_id not in current:
+                inserts.append(r)
+            elif current[component_id] != tuple(r):
+                # UPDATE ... SET col=?, ... WHERE component_id=?
+                updates.append(r + [component_id])
+
+        deletes = [[k] for k in current if k not in incoming]
+
+        self._executeBatches('DELETE FROM %s WHERE component_id=?' 
+                             % quoteIdentifier(table), deletes)
+
+        self._executeBatches('UPDATE %s SET %s WHERE component_id=?' % (
+            quoteIdentifier(table), 
+            ','.join('%s=?' % c for c in quoted_columns)), updates)
+
+        self._insert(table, columns, inserts)
+
+        self._addStats(start, len(inserts), len(updates), len(deletes))
+
+        return len(inserts), len(updates), len(deletes)
+
+    def buildSearchCategory(self, categories):
+        # The cross-category search table, or None if it is disabled.
+        if len(self.search_table) == 0:
+            return None
+
+        if self.search_table in categories:
+            raise Exception('Category "%s" has the same name as the search '
+                            'table, set another search_table in the database '
+                            'config.' % self.search_table)
+
+        return SearchCategory(self.search_table, categories, self.search_fields)
+
+    def _addStats(self, start, inserted=0, updated=0, deleted=0):
+        with self._lock:
+            self.rows_loaded += inserted + updated + deleted
+            self.rows_inserted += inserted
+            self.rows_updated += updated
+            self.rows_deleted += deleted
+            self.load_seconds += time.perf_counter() - start
+
+    def loadRows(self, table, columns, rows):
+        if self.sync_mode == 'incremental':
+            return self.syncRows(table, columns, rows)
+        elif self.sync_mode == 'shadow':
+            return self.insertRows(LibraryDatabase.STAGING_PREFIX + table, 
+                                   columns, rows)
+        return self.insertRows(table, columns, rows)
+
+    def _executeBatches(self, query, rows):
+        # Run query once per row with executemany, insert_batch_size rows at a
+        # time.  Returns the number of rows sent.
+        batch = []
+        count = 0
+
+        for row in rows:
+            batch.append(row)
+
+            if len(batch) >= self._insert_batch_size:
+                self._cursor.executemany(query, batch)
+                count += len(batch)
+                batch = []
+
+        if len(batch) > 0:
+            self._cursor.executemany(query, batch)
+            count += len(batch)
+
+        return count
+
+    def getTableSchemas(self):
+        # Map every table in the library schema to the schema hash that was
+        # stored with it when it was created.
+        return self._backend.getTableSchemas(self._cursor)
+
+    def matchesSchema(self, categories):
+        # Whether every category already has a table with its schema, e.g.
+        # before skipping the sync of an unchanged sheet.  Catches a wiped
+        # or different database, and indexes or a search table that were
+        # configured since.
+        schemas = self.getTableSchemas()
+
+        return all(c in schemas and 
+                   schemas[c] == categories[c].schema_hash(self.indexed_fields)
+                   for c in categories)
+
+    def dropChangedTables(self, categories):
+        # Drop tables that no longer have a category, or whose header row
+        # changed since they were created.  Returns the number dropped.
+        schemas = self.getTableSchemas()
+        dropped = 0
+
+        for t in schemas:
+            if (t not in categories or 
+                    schemas[t] != categories[t].schema_hash(self.indexed_fields)):
+                self._backend.dropTable(self._cursor, t)
+                dropped += 1
+
+        return dropped
+
+    def createMissingTables(self, categories):
+        # Create a table for every category that does not have one.  Returns
+        # the number created.
+        schemas = self.getTableSchemas()
+        created = 0
+
+        for c in categories:
+            if c not in schemas:
+                self._backend.createTable(self._cursor, categories[c], c, 
+                                          self.indexed_fields)
+                created += 1
+
+        return created
+
+    def widenColumns(self, categories):
+        # Widen the columns of existing tables that are too narrow for the
+        # longest value of their category, which does not change the schema
+        # hash.  Returns the number of columns widened.
+        schemas = self.getTableSchemas()
+        widened = 0
+
+        for c in categories:
+            if c in schemas:
+                widened += self._backend.widenColumns(self._cursor, 
+                    categories[c], c, self.indexed_fields)
+
+        return widened
+
+    def createTables(self, categories, prefix=''):
+        for c in categories:
+            self._backend.createTable(self._cursor, categories[c], prefix + c, 
+                                      self.indexed_fields)
+
+        return len(categories)
+
+    def dropStagingTables(self):
+        # Remove staging and retired tables left behind by an interrupted
+        # shadow sync.  Returns the number dropped.
+        dropped = 0
+
+        for t in self.getTableSchemas():
+            if (t.startswith(LibraryDatabase.STAGING_PREFIX) or 
+                    t.startswith(LibraryDatabase.RETIRED_PREFIX)):
+                self._backend.dropTable(self._cursor, t)
+                dropped += 1
+
+        return dropped
+
+    def createStagingTables(self, categories):
+        return self.createTables(categories, LibraryDatabase.STAGING_PREFIX)
+
+    def swapStagingTables(self, categories):
+        # Move every staging table into place in one atomic step, so readers
+        # see either the old library or the new one and never a missing or
+        # empty table.  Live tables without a category are retired in the
+        # same step.  Returns the number of tables swapped in.
+        live_tables = [t for t in self.getTableSchemas() 
+                       if not t.startswith(LibraryDatabase.STAGING_PREFIX) and 
+                          not t.startswith(LibraryDatabase.RETIRED_PREFIX)]
+
+        renames = []
+        for t in live_tables:
+            renames.append((t, LibraryDatabase.RETIRED_PREFIX + t))
+        for c in categories:
+            renames.append((LibraryDatabase.STAGING_PREFIX + c, c))
+
+        self._backend.renameTables(self._cursor, renames)
+
+        for t in live_tables:
+            self._backend.dropTable(self._cursor, 
+                                    LibraryDatabase.RETIRED_PREFIX + t)
+
+        return len(categories)
+
     def dropAllTables(self):
-        query  = "SELECT CONCAT('DROP TABLE IF EXISTS `', table_name, '`;') "
-        query += "FROM information_schema.tables "
-        query += "WHERE table_schema = '%s';" % self._config['database']
+        tables = list(self.getTableSchemas())
+
+        for t in tables:
+            self._backend.dropTable(self._cursor, t)
+
+        return len(tables)
+
+    def getConnectionString(self):
+        return self._backend.getConnectionString()
+
+    def getDbLibOptions(self):
+        # DatabaseLinks settings of the DbLib that depend on the backend.
+        return self._backend.dblib_options
+
+    def close(self):
+        self.releaseConnections()
+        if self._pool is not None:
+            self._pool.close()
+        self._conn.close()
+
+
+class CountingCursor:
+
+    # Counts the statements and rows sent through a cursor in the metrics of
+    # the database it belongs to.
 
-        self._cursor.execute(query)
-        drop_statements = self._cursor.fetchall()
+    def __init__(self, cursor, database):
+        self._cursor = cursor
+        self._database = database
 
-        for q in drop_statements:
-            self._cursor.execute(q[0])
+    def execute(self, query, *args):
+        self._database.metrics.count('sql_statements')
+        return self._cursor.execute(query, *args)
 
-        return len(drop_statements)
+    def executemany(self, query, rows):
+        self._database.metrics.count('sql_statements')
+        self._database.metrics.count('sql_rows', len(rows))
+        return self._cursor.executemany(query, rows)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class MariaDBBackend:
+
+    # Library database on a MariaDB (or MySQL) server, shared by every
+    # workstation over the network.
+
+    supports_bulk_load = True
+
+    dblib_options = {}
+
+    def __init__(self, database_config):
+        if mariadb is None:
+            raise Exception('The mariadb package is needed for the mariadb '
+                            'database backend.')
+
+        self._config = database_config
+        self.Error = mariadb.Error
+
+    def describe(self):
+        return '%s@%s:%s (%s)' % (self._config['user'], self._config['host'],
+                                  self._config['port'], self._config['database'])
+
+    def _connectionArgs(self):
+        return {
+            'user': self._config['user'],
+            'password': self._config['password'],
+            'host': self._config['host'],
+            'port': int(self._config['port']),
+            'database': self._config['database'],
+            # Needed by LOAD DATA LOCAL INFILE for large categories.
+            'local_infile': self._config.getint('bulk_load_threshold', 
+                                                fallback=20000) > 0
+        }
+
+    def connect(self):
+        try:
+            return mariadb.connect(**self._connectionArgs())
+        except mariadb.Error as e:
+            raise Exception("Error connecting to specified database.")
+
+    def createPool(self, size):
+        try:
+            return mariadb.ConnectionPool(pool_name='altium_library',
+                pool_size=size, **self._connectionArgs())
+        except mariadb.Error as e:
+            raise Exception("Error creating database connection pool.")
+
+    def ping(self, conn):
+        try:
+            conn.ping()
+            return True
+        except mariadb.Error:
+            return False
+
+    def getTableSchemas(self, cursor):
+        # The schema hash is kept in the table comment.
+        cursor.execute(
+            "SELECT table_name, table_comment FROM information_schema.tables "
+            "WHERE table_schema = ?", (self._config['database'],))
+
+        schemas = {}
+        for table_name, comment in cursor.fetchall():
+            if comment.startswith('schema:'):
+                schemas[table_name] = comment[len('schema:'):]
+            else:
+                schemas[table_name] = None
+        return schemas
+
+    def createTable(self, cursor, category, table_name, indexed_fields):
+        cursor.execute(category.generate_create_table(table_name, indexed_fields))
+
+    def widenColumns(self, cursor, category, table_name, indexed_fields):
+        cursor.execute(
+            "SELECT column_name, data_type, character_maximum_length "
+            "FROM information_schema.columns "
+            "WHERE table_schema = ? AND table_name = ?", 
+            (self._config['database'], table_name))
+
+        current = {}
+        for name, data_type, length in cursor.fetchall():
+            if data_type.lower() == 'varchar':
+                current[name] = length
+            elif data_type.lower() == 'text':
+                current[name] = column_width('TEXT')
+
+        columns, indexes = category.table_schema(indexed_fields)
+        changes = []
+        texts = []
+
+        for name, sql_type, default in columns:
+            width = column_width(sql_type)
+            if width is None or name not in current or width <= current[name]:
+                continue
+            changes.append('MODIFY %s %s' % (quoteIdentifier(name), sql_type))
+            if sql_type == 'TEXT':
+                texts.append(name)
+
+        # A TEXT column can only be indexed by a prefix, so its indexes are
+        # made again along with it.
+        for kind, index_name, index_columns in indexes:
+            if kind != 'fulltext' and any(c in texts for c, p in index_columns):
+                changes.insert(0, 'DROP INDEX %s' % quoteIdentifier(index_name))
+                changes.append('ADD %s %s (%s)' % (INDEX_KEYWORDS[kind], 
+                    quoteIdentifier(index_name), ','.join(
+                    quoteIdentifier(c) if prefix is None else 
+                    '%s(%i)' % (quoteIdentifier(c), prefix) 
+                    for c, prefix in index_columns)))
+
+        if len(changes) > 0:
+            cursor.execute('ALTER TABLE %s %s' % (quoteIdentifier(table_name), 
+                                                  ', '.join(changes)))
+
+        return sum(c.startswith('MODIFY ') for c in changes)
+
+    def dropTable(self, cursor, table_name):
+        cursor.execute('DROP TABLE IF EXISTS %s;' % quoteIdentifier(table_name))
+
+    def renameTables(self, cursor, renames):
+        # MariaDB applies all the renames of one RENAME TABLE atomically.
+        cursor.execute('RENAME TABLE %s;' % ', '.join(
+            '%s TO %s' % (quoteIdentifier(old), quoteIdentifier(new)) 
+            for old, new in renames))
+
+    def bulkLoadRows(self, cursor, table, columns, rows):
+        # Stream rows into a table with LOAD DATA LOCAL INFILE, by way of a
+        # temporary tab separated file.
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', newline='', 
+                                         suffix='.tsv', delete=False) as f:
+            path = f.name
+            for r in rows:
+                f.write('\t'.join(escapeLoadDataValue(v) for v in r))
+                f.write('\n')
+
+        try:
+            cursor.execute(
+                "LOAD DATA LOCAL INFILE '%s' INTO TABLE %s CHARACTER SET utf8mb4 "
+                "FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' "
+                "LINES TERMINATED BY '\\n' (%s)" % (
+                    path.replace('\\', '\\\\').replace("'", "\\'"),
+                    quoteIdentifier(table),
+                    ','.join(quoteIdentifier(c) for c in columns)))
+        finally:
+            os.remove(path)
+
+        return len(rows)
 
     def getConnectionString(self):
         return ('Driver={MySQL ODBC 8.0 Unicode Driver};SERVER=%s;USER=%s;'
@@ -70,5 +593,178 @@ class LibraryDatabase:
                  self._config['password'], self._config['database'],
                  self._config['port']))
 
-    def close(self):
-        self._conn.close()
\ No newline at end of file
+
+class SQLiteBackend:
+
+    # Library database in a local SQLite file.  Each workstation can open a
+    # copy of the file through the SQLite ODBC driver, so browsing the
+    # library runs at local disk speed instead of over the network, and it
+    # needs no database server at all.
+
+    Error = sqlite3.Error
+
+    supports_bulk_load = False
+
+    # SQLite has no table comments, so schema hashes are kept in this table.
+    SCHEMA_TABLE = '_library_schema'
+
+    dblib_options = {
+        'LeftQuote': '"',
+        'RightQuote': '"'
+    }
+
+    def __init__(self, database_config):
+        self._config = database_config
+        self.path = database_config['path']
+
+    def describe(self):
+        return 'file %s' % self.path
+
+    def connect(self):
+        try:
+            # Worker threads share the single connection.
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute('CREATE TABLE IF NOT EXISTS %s (table_name TEXT '
+                         'PRIMARY KEY, schema_hash TEXT)' 
+                         % quoteIdentifier(SQLiteBackend.SCHEMA_TABLE))
+            conn.commit()
+        except sqlite3.Error as e:
+            raise Exception("Error opening specified database file.")
+
+        return conn
+
+    def createPool(self, size):
+        # SQLite only has one writer at a time, so a pool would not help.
+        return None
+
+    def ping(self, conn):
+        return True
+
+    def getTableSchemas(self, cursor):
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' "
+                       "AND name NOT LIKE 'sqlite\\_%' ESCAPE '\\' "
+                       "AND name != ?", (SQLiteBackend.SCHEMA_TABLE,))
+        schemas = dict((r[0], None) for r in cursor.fetchall())
+
+        cursor.execute('SELECT table_name, schema_hash FROM %s' 
+                       % quoteIdentifier(SQLiteBackend.SCHEMA_TABLE))
+        for table_name, schema_hash in cursor.fetchall():
+            if table_name in schemas:
+                schemas[table_name] = schema_hash
+        return schemas
+
+    def createTable(self, cursor, category, table_name, indexed_fields):
+        columns, indexes = category.table_schema(indexed_fields)
+
+        definition = ['id INTEGER PRIMARY KEY AUTOINCREMENT']
+        for name, sql_type, default in columns:
+            column = '%s %s' % (quoteIdentifier(name), sql_type)
+            if name == 'component_id':
+                column += ' NOT NULL'
+            if default is not None:
+                column += " DEFAULT '%s'" % default.replace("'", "''")
+            definition.append(column)
+
+        cursor.execute('CREATE TABLE %s (%s)' % (quoteIdentifier(table_name), 
+                                                 ','.join(definition)))
+
+        # Index names are global in SQLite and stay with a table when it is
+        # renamed, so a staging table needs different names from the live
+        # table it replaces.
+        suffix = uuid.uuid4().hex[:8]
+        for kind, name, index_columns in indexes:
+            if kind == 'fulltext':
+                # There is no FULLTEXT index in SQLite.  Searches fall back
+                # to LIKE over the table.
+                continue
+            cursor.execute('CREATE %sINDEX %s ON %s (%s)' % (
+                'UNIQUE ' if kind == 'unique' else '',
+                quoteIdentifier('%s_%s_%s' % (table_name, name, suffix)),
+                quoteIdentifier(table_name),
+                ','.join(quoteIdentifier(c) for c, prefix in index_columns)))
+
+        cursor.execute('INSERT OR REPLACE INTO %s VALUES (?, ?)' 
+                       % quoteIdentifier(SQLiteBackend.SCHEMA_TABLE),
+                       (table_name, category.schema_hash(indexed_fields)))
+
+        # Schema changes commit straight away, like they do in MariaDB.
+        cursor.connection.commit()
+
+    def widenColumns(self, cursor, category, table_name, indexed_fields):
+        # SQLite does not enforce VARCHAR lengths, so longer values already
+        # fit.
+        return 0
+
+    def dropTable(self, cursor, table_name):
+        cursor.execute('DROP TABLE IF EXISTS %s;' % quoteIdentifier(table_name))
+        cursor.execute('DELETE FROM %s WHERE table_name = ?' 
+                       % quoteIdentifier(SQLiteBackend.SCHEMA_TABLE), 
+                       (table_name,))
+        cursor.connection.commit()
+
+    def renameTables(self, cursor, renames):
+        # Schema changes are transactional in SQLite, so renaming every table
+        # inside one transaction is as atomic as MariaDB's RENAME TABLE.
+        if cursor.connection.in_transaction:
+            cursor.connection.commit()
+
+        cursor.execute('BEGIN')
+        try:
+            for old, new in renames:
+                cursor.execute('ALTER TABLE %s RENAME TO %s' % (
+                    quoteIdentifier(old), quoteIdentifier(new)))
+                cursor.execute('DELETE FROM %s WHERE table_name = ?'
+                               % quoteIdentifier(SQLiteBackend.SCHEMA_TABLE),
+                               (new,))
+                cursor.execute('UPDATE %s SET table_name = ? WHERE table_name = ?'
+                               % quoteIdentifier(SQLiteBackend.SCHEMA_TABLE),
+                               (new, old))
+            cursor.execute('COMMIT')
+        except sqlite3.Error:
+            cursor.execute('ROLLBACK')
+            raise
+
+    def bulkLoadRows(self, cursor, table, columns, rows):
+        raise Exception('Bulk loading is not supported by the sqlite backend.')
+
+    def getConnectionString(self):
+        # The path the workstations open the replica from, which may differ
+        # from where the sync writes it.
+        path = self._config.get('odbc_path', os.path.abspath(self.path))
+        driver = self._config.get('odbc_driver', 'SQLite3 ODBC Driver')
+        return 'Driver={%s};Database=%s;' % (driver, path)
+
+
+BACKENDS = {
+    'mariadb': MariaDBBackend,
+    'sqlite': SQLiteBackend
+}
+
+
+def getBackend(database_config):
+    backend = database_config.get('backend', 'mariadb')
+    if backend not in BACKENDS:
+        raise Exception('Unknown database backend "%s" in database config.' 
+                        % backend)
+    return BACKENDS[backend](database_config)
+
+
+def quoteIdentifier(name):
+    return '`%s`' % name.replace('`', '``')
+
+
+def escapeLoadDataValue(value):
+    # Escape a value for a LOAD DATA file using the default escape character,
+    # where \N is NULL.
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r').replace('\0', '\\0'))
+
+
+def padRow(row, length):
+    # Rows from the sheet stop at their last non-empty cell.  Pad them with
+    # NULL (or cut off anything past the header) so every row has a value
+    # for each column.
+    row = list(row[:length])
+    return row + [None] * (length - len(row))
\ No newline at end of file
@@ -21,37 +21,205 @@
 # SOFTWARE.
 
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import configparser
 import json
+import os
+import threading
 import uuid
+from urllib.parse import quote
 
 from googleapiclient.discovery import build
+import httplib2
 from oauth2client.service_account import ServiceAccountCredentials
 
 from termcolor import colored
 
+from .altium import ALTIUM_SPECIAL_FIELDS
+from .column_store import ColumnStore
+from .instrumentation import SyncMetrics
 from .models import Category, Field
+from .populator_cache import PopulatorCache
+from .populators import BatchPopulator, populatorName
+from .sheets_transport import SheetsTransport
 
 
 class GSheetReader:
 
     COLUMN_NAMES = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    BATCH_GET_URL = ('https://sheets.googleapis.com/v4/spreadsheets/%s'
+                     '/values:batchGet?majorDimension=ROWS&')
 
-    def __init__(self, gsheet_config):
-        # use creds to create a client to interact with the Google Drive API
-        creds = ServiceAccountCredentials.from_json_keyfile_name(
+    def __init__(self, gsheet_config, track_revision=False, sheets=None, 
+                 files=None, transport=None):
+        # sheets and files stand in for the Sheets spreadsheets() and Drive 
+        # files() resources, e.g. for the benchmarks.  Without them, use creds
+        # to create a client to interact with the Google Drive API.  Readers
+        # of several spreadsheets share one transport, as the API quotas are
+        # per user rather than per spreadsheet.
+        if sheets is None:
+            self._creds = ServiceAccountCredentials.from_json_keyfile_name(
                     gsheet_config['secret_file'], 
-                    ['https://www.googleapis.com/auth/spreadsheets']) # scope
+                    ['https://www.googleapis.com/auth/spreadsheets',
+                     'https://www.googleapis.com/auth/drive.metadata.readonly'])
 
-        service = build('sheets', 'v4', credentials=creds)
-        self._sheet = service.spreadsheets()
+            service = build('sheets', 'v4', credentials=self._creds)
+            sheets = service.spreadsheets()
+        else:
+            self._creds = None
+
+        self._sheet = sheets
+        self._files = files
+        self._local = threading.local()
 
         self._config = gsheet_config
+        self._owns_transport = transport is None
+        if transport is None:
+            transport = SheetsTransport(self._execute, gsheet_config)
+        self._transport = transport
+        self._writes = SheetWriteBuffer(self._sheet, gsheet_config['sheet_id'],
+                           gsheet_config.getint('write_flush_size', fallback=500),
+                           self._transport)
+        self._revision = None
+        self._cache_data = None
+        self._populator_cache = None
+        self._populator_names = {}
+        self.track_revision = track_revision
+        self.unchanged = False
+        self.metrics = SyncMetrics()
+
+    def getRevision(self):
+        # The Sheets API does not expose a revision, but the Drive file version
+        # changes with every edit to the spreadsheet and is cheap to fetch.
+        if self._files is None:
+            self._files = build('drive', 'v3', credentials=self._creds).files()
+
+        return self._request('sheets_revision_requests', 'read', self._files.get(
+            fileId=self._config['sheet_id'], fields='version', 
+            supportsAllDrives=True))['version']
+
+    def _tryRevision(self):
+        # The revision, or None if it cannot be fetched (e.g. the Drive API is
+        # not enabled for the service account's project), in which case the
+        # sheet is read and synced as if it changed.
+        try:
+            return self.getRevision()
+        except Exception as e:
+            self.metrics.count('sheets_revision_errors')
+            print(colored('\n -> Could not get the revision of sheet %s, '
+                          'reading it whole: %s' % (self._config['sheet_id'], e),
+                          'yellow'), flush=True)
+            return None
+
+    def hasChanged(self):
+        # Only meaningful when the revision was recorded by the last read,
+        # either for the cache or with track_revision.
+        if self._revision is None:
+            return True
+        return self._tryRevision() != self._revision
 
     def readAndValidateCategories(self): 
 
-        sheet_metadata = self._sheet.get(
-            spreadsheetId=self._config['sheet_id']).execute()
+        cache_file = self._config.get('cache_file', '')
+        cached = None
+        revision = None
+
+        # Writes left over from an earlier failed sync are stale.
+        self._writes.reset()
+        if self._owns_transport:
+            self._transport.resetStats()
+
+        if len(cache_file) > 0 or self.track_revision:
+            revision = self._tryRevision()
+
+        if len(cache_file) > 0 and revision is not None:
+            cached = self._loadCache(cache_file, revision)
+
+        self.unchanged = cached is not None
+
+        if cached is not None:
+            sheet_metadata = cached['metadata']
+        else:
+            sheet_metadata = self._readMetadata()
+
+        self._createCategories(sheet_metadata)
+
+        if cached is not None:
+            category_rows = cached['values']
+        elif self._config.getboolean('batch_read', fallback=True):
+            category_rows = self._batchReadCategories(list(self.categories))
+        else:
+            category_rows = self._readCategories(list(self.categories))
+        self._countTransport()
+
+        self._revision = revision
+        self._cache_data = {
+            'sheet_id': self._config['sheet_id'],
+            'revision': revision,
+            'metadata': sheet_metadata,
+            'headers': {}
+        }
+
+        for c in self.categories:
+            # Only the compact copy of the rows is kept.  The header rows are
+            # kept as read, so that saveCache can rebuild the sheet.
+            rows = category_rows.pop(c)
+
+            if len(rows) > 0:
+                header_row = rows[0]
+                self._cache_data['headers'][c] = header_row
+            else:
+                header_row = []
+            self.categories[c].raw_rows = ColumnStore(rows[1:])
+            del rows
+
+            self._addFields(c, header_row)
+
+            # Component IDs are the library key, and have a unique index in
+            # the database.  Copied rows must get their ID cleared in the sheet.
+            duplicates = self.categories[c].find_duplicate_component_ids()
+            if len(duplicates) > 0:
+                raise Exception(
+                    'Category "%s" has duplicate Component ID(s): %s. Clear the '
+                    'Component ID of copied rows to assign new ones.'
+                    % (c, duplicates))
+
+        return len(self.categories)
+
+    def readHeaders(self):
+        # Like readAndValidateCategories, but only reads the header row of
+        # each tab, leaving raw_rows as None, for streamComponents to read
+        # the rest.  The sheet cache holds whole tabs, so it is not used.
+        self._writes.reset()
+        if self._owns_transport:
+            self._transport.resetStats()
+        self._cache_data = None
+        self.unchanged = False
+
+        revision = None
+        if self.track_revision:
+            revision = self._tryRevision()
+
+        self._createCategories(self._readMetadata())
+
+        category_rows = self._batchReadCategories(list(self.categories), '1:1')
+        self._countTransport()
 
+        for c in self.categories:
+            rows = category_rows[c]
+            self._addFields(c, rows[0] if len(rows) > 0 else [])
+
+        self._revision = revision
+
+        return len(self.categories)
+
+    def _readMetadata(self):
+        return self._request('sheets_metadata_requests', 'read',
+            self._sheet.get(spreadsheetId=self._config['sheet_id'],
+                fields='sheets.properties(title,gridProperties)'))
+
+    def _createCategories(self, sheet_metadata):
         self.categories = {}
 
         for s in sheet_metadata['sheets']:
@@ -59,97 +227,882 @@ class GSheetReader:
             row_count = s['properties']['gridProperties']['rowCount']
             self.categories[category_name] = Category(category_name, row_count)
 
+    def _addFields(self, c, header_row):
         if 'custom_required_fields' in self._config:
             custom_req = json.loads(self._config['custom_required_fields'])
         else:
             custom_req = []
 
-        invalid_categories = []
+        for h in header_row:
+            self.categories[c].add_field(Field(h))
+        
+        missing_fields = self.categories[c].get_missing_required_fields(
+            custom_req
+        )
+
+        if len(missing_fields) > 0:
+            raise Exception(
+                'Category "%s" is missing field(s): %s, removing from list.'
+                % (c, missing_fields))
+
+    def _readCategories(self, category_names):
+        # One request per tab, run concurrently by the transport.
+        responses = self._gather('sheets_read_requests', 'read', [
+            self._sheet.values().get(spreadsheetId=self._config['sheet_id'],
+                range=GSheetReader.categoryRange(c)) for c in category_names])
+
+        category_rows = {}
+        for c, response in zip(category_names, responses):
+            category_rows[c] = response.get('values', [])
+            self._countFetched(category_rows[c])
+
+        return category_rows
+
+    def _request(self, counter, kind, request):
+        self.metrics.count(counter)
+        return self._transport.execute(kind, request)
+
+    def _gather(self, counter, kind, requests):
+        self.metrics.count(counter, len(requests))
+        return self._transport.gather(kind, requests)
+
+    def _countTransport(self):
+        self.metrics.setCounter('sheets_retries', self._transport.retries)
+        self.metrics.setCounter('sheets_throttle_seconds', 
+                                self._transport.throttle_seconds)
+
+    def _countFetched(self, rows):
+        # The UTF-8 size of the cell text, leaving out the JSON around it.
+        # Each row is encoded in one go, which is much faster than cell by
+        # cell.
+        self.metrics.count('sheets_cells_fetched', sum(map(len, rows)))
+        self.metrics.count('sheets_bytes_fetched', 
+                           sum(len(''.join(r).encode('utf-8')) for r in rows))
+
+    def _execute(self, request):
+        # The HTTP client behind the service is not thread safe, so requests
+        # made from worker threads each use a per-thread connection.
+        if (self._creds is None or 
+                threading.current_thread() is threading.main_thread()):
+            return request.execute()
+
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = self._local.http = self._creds.authorize(httplib2.Http())
+        return request.execute(http=http)
+
+    def _loadCache(self, cache_file, revision):
+        # Return the cached spreadsheet if it was saved at this revision.
+        try:
+            with open(cache_file, 'r') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if (cached.get('sheet_id') != self._config['sheet_id'] or 
+                cached.get('revision') != revision):
+            return None
+
+        return cached
+
+    def saveCache(self):
+        # Save the spreadsheet as read by the last readAndValidateCategories.
+        # Call this only after a successful sync, so an unchanged revision
+        # always means the library already matches the sheet.  The rows
+        # include what this sync wrote to the sheet, and are saved under the
+        # revision after those writes, unless the sheet may have been edited
+        # in the meantime (see _flushWrites), and the next sync has to read
+        # the sheet again.
+        cache_file = self._config.get('cache_file', '')
+
+        if len(cache_file) == 0 or self._cache_data is None:
+            return False
+
+        if self._cache_data['revision'] is None:
+            if os.path.isfile(cache_file):
+                os.remove(cache_file)
+            return False
+
+        cache_data = dict(self._cache_data)
+        cache_data['values'] = dict((c, [cache_data['headers'][c]] + 
+                                        list(self.categories[c].raw_rows)) 
+                                    if c in cache_data['headers'] else (c, [])
+                                    for c in self.categories)
+        del cache_data['headers']
+
+        with open(cache_file + '.tmp', 'w') as f:
+            json.dump(cache_data, f)
+        os.replace(cache_file + '.tmp', cache_file)
+
+        return True
+
+    def _batchReadCategories(self, category_names, rows=None):
+        # rows limits the read to a span of rows of every tab, e.g. '1:1'.
+        if rows is None:
+            ranges = [GSheetReader.categoryRange(c) for c in category_names]
+        else:
+            ranges = ['%s!%s' % (GSheetReader.categoryRange(c), rows) 
+                      for c in category_names]
+
+        return self._batchRead(category_names, ranges)
+
+    def _batchRead(self, keys, ranges):
+        # Read the ranges with batchGet, returning the rows of each by its
+        # key.
+        # The ranges are sent as query parameters of a GET request, so split
+        # them into as few batchGet calls as will fit under the URL limit.
+        max_url = self._config.getint('batch_read_max_url', fallback=2000)
+        base_length = len(GSheetReader.BATCH_GET_URL % self._config['sheet_id'])
+
+        chunks = [[]]
+        url_length = base_length
+        for k, r in zip(keys, ranges):
+            param_length = len('ranges=&') + len(quote(r, safe=''))
+            if len(chunks[-1]) > 0 and url_length + param_length > max_url:
+                chunks.append([])
+                url_length = base_length
+            chunks[-1].append((k, r))
+            url_length += param_length
+
+        responses = self._gather('sheets_read_requests', 'read', [
+            self._sheet.values().batchGet(
+                spreadsheetId=self._config['sheet_id'],
+                ranges=[r for k, r in chunk],
+                majorDimension='ROWS') for chunk in chunks])
+
+        values = {}
+
+        for chunk, response in zip(chunks, responses):
+            # Value ranges are returned in the same order they were requested.
+            for (k, r), value_range in zip(chunk, response.get('valueRanges', [])):
+                values[k] = value_range.get('values', [])
+                self._countFetched(values[k])
+
+        return values
+
+    def _readExtents(self):
+        # The last used row of each tab.  The grid usually runs far past the
+        # data, so the required columns of every tab are read first, which
+        # come back without the blank rows at the end.  Rows with none of
+        # the required fields filled in after the last such row are left
+        # out.
+        custom_req = json.loads(self._config.get('custom_required_fields', 
+                                                 '[]'))
+        keys = []
+        ranges = []
 
         for c in self.categories:
-            rows = self._sheet.values().get(
-                spreadsheetId=self._config['sheet_id'], 
-                range='%s!1:%i' % (c, self.categories[c].row_count)).execute().get('values')
-
-            header_row = rows[0]
-            self.categories[c].raw_rows = rows[1:]
-
-            for h in header_row:
-                self.categories[c].add_field(Field(h))
-            
-            missing_fields = self.categories[c].get_missing_required_fields(
-                custom_req
-            )
-
-            if len(missing_fields) > 0:
-                invalid_categories.append(c)
-                raise Exception(
-                    'Category "%s" is missing field(s): %s, removing from list.'
-                    % (c, missing_fields))
+            fields = [f.altium_name for f in self.categories[c].fields]
+            # Every tab has these fields, or readHeaders rejected it.
+            for f in ['Component ID'] + ALTIUM_SPECIAL_FIELDS + custom_req:
+                column = GSheetReader.columnName(fields.index(f))
+                keys.append((c, f))
+                ranges.append('%s!%s:%s' % (GSheetReader.categoryRange(c), 
+                                            column, column))
 
-        return len(self.categories)
+        values = self._batchRead(keys, ranges)
+
+        extents = dict((c, 1) for c in self.categories)
+        for c, f in keys:
+            extents[c] = max(extents[c], len(values[(c, f)]))
+
+        return extents
+
+    @staticmethod
+    def categoryRange(category_name):
+        # A range made of only the tab name returns the used data extent of the
+        # tab, rather than every (mostly blank) row in the grid.
+        return "'%s'" % category_name.replace("'", "''")
+
+    @staticmethod
+    def columnName(column_index):
+        # Convert a zero based column index to A1 notation, continuing past
+        # Z the same way the sheet does (Z, AA, AB, ...).
+        name = ''
+        column_index += 1
+        while column_index > 0:
+            column_index, remainder = divmod(column_index - 1, 26)
+            name = GSheetReader.COLUMN_NAMES[remainder] + name
+        return name
+
+    def populateComponents(self, field_populators=[], workers=1):
+
+        # Assign Component IDs to new rows and run the field populators.  This
+        # can run before the tables are created, so their columns are sized
+        # for the populated values.  Per-row populators run first, then the
+        # BatchPopulators in order.  Returns the number of new IDs.
+        row_populators = [f for f in field_populators 
+                          if not isinstance(f, BatchPopulator)]
+
+        self._openPopulatorCache(field_populators)
+
+        try:
+            count = sum(self._mapCategories(
+                lambda c: self._populateCategory(c, row_populators), workers))
+
+            for f in field_populators:
+                if isinstance(f, BatchPopulator):
+                    self._runBatchPopulator(f)
+
+        finally:
+            self._closePopulatorCache()
+
+        return count
+
+    def _openPopulatorCache(self, field_populators):
+        cache_file = self._config.get('populator_cache', '')
+        if len(cache_file) > 0 and len(field_populators) > 0:
+            self._populator_cache = PopulatorCache(cache_file,
+                self._config.getfloat('populator_cache_ttl', fallback=604800),
+                self._config.getint('populator_cache_size', fallback=100000))
+
+            # Results are keyed by populator name, so populators without a
+            # name of their own, or sharing one, are never cached.
+            names = [populatorName(f) for f in field_populators]
+            self._populator_names = {}
+            for f, name in zip(field_populators, names):
+                if name is None or names.count(name) > 1:
+                    print(colored('\n -> Not caching populator %r, it needs a '
+                        'unique name attribute.' % f, 'yellow'), 
+                        end='', flush=True)
+                else:
+                    self._populator_names[id(f)] = name
+
+    def _closePopulatorCache(self):
+        if self._populator_cache is not None:
+            # Keep what was computed even if a populator failed.
+            self._populator_cache.save()
+            self._populator_cache.close()
+            hits, misses = self._populator_cache.hitCounts()
+            self.metrics.count('populator_cache_hits', hits)
+            self.metrics.count('populator_cache_misses', misses)
+            self._populator_cache = None
 
     def addComponentsToDatabase(self, database, field_populators=[]):
 
-        new_id_count = 0
-        component_count = 0
+        # Categories load into separate tables, so with a database connection
+        # pool they can be populated and loaded side by side.
+        self.populateComponents(field_populators, database.pool_size)
 
-        for c in self.categories:
-            parts_rows = self.categories[c].raw_rows
-            # parts_rows = self._sheet.values().get(
-            #     spreadsheetId=self._config['sheet_id'], range='%s!2:%i' 
-            #         % (c, self.categories[c].row_count)).execute().get('values')
-    
-            componet_id_index = self.categories[c].field_index('component_id')
-
-            for row_index in range(len(parts_rows)):
-                if (len(parts_rows[row_index]) == 0):
-                    continue
-                
-                if parts_rows[row_index][componet_id_index] == '':
-                    new_uuid = uuid.uuid4()
-                    self._sheet.values().update(
-                        spreadsheetId=self._config['sheet_id'], 
-                        range='%s!%s%i' 
-                        % (c, GSheetReader.COLUMN_NAMES[componet_id_index], 
-                            row_index+2), valueInputOption='RAW',
-                            body={'values':[[str(new_uuid)]]}).execute()
-
-                    print(colored('\n -> Assigned Component ID "%s" for row %i in category "%s"' 
-                            % (new_uuid, row_index+2, c), 'green'), end='', flush=True)
-
-                    parts_rows[row_index][componet_id_index] = str(new_uuid)
-                    new_id_count += 1
-
-                for f in field_populators:
-                    val, update_index = f(self.categories[c], parts_rows[row_index])
-                    if update_index >= 0:
-                        self._sheet.values().update(
-                            spreadsheetId=self._config['sheet_id'], 
-                            range='%s!%s%i' 
-                            % (c, GSheetReader.COLUMN_NAMES[update_index], 
-                                row_index+2), valueInputOption='RAW',
-                                body={'values':[[str(val)]]}).execute()
-                        parts_rows[row_index][update_index] = str(val)
-                    
-                # TODO: sanitize inputs
-                query = "INSERT INTO `%s` (" % c
-
-                for field_index in range(len(parts_rows[row_index])):
-                    query += "`%s`," % self.categories[c].fields[field_index].database_name
-
-                query = query[:-1] + ') VALUES ('
-
-                for column_index in range(len(parts_rows[row_index])):
-                    query += "'%s'," % parts_rows[row_index][column_index]
-
-                query = query[:-1] + ');'
-        
-                database.execute(query)
-                component_count += 1
+        counts = self._mapCategories(
+            lambda c: self._loadCategory(database, c), database.load_workers)
+
+        # Write the new IDs back to the sheet before committing, so a failed
+        # write does not leave components in the database under IDs that the
+        # sheet never received.
+        self._flushWrites()
+        self.metrics.count('sheets_write_requests', self._writes.requests)
+        self.metrics.count('sheets_cells_written', self._writes.written)
+        self._countTransport()
         
         database.commit()
         
         print('')
         
-        return component_count
\ No newline at end of file
+        return sum(counts)
+
+    def _flushWrites(self):
+        # Write the pending cells back to the sheet.  The write changes the
+        # revision, so if the sheet was not edited since it was read, the
+        # revision after the write is recorded instead, and the sync's own
+        # writes do not count as a change for hasChanged or the sheet cache.
+        # Otherwise the next check sees the sheet as changed.
+        if len(self._writes) == 0:
+            return
+
+        unedited = (self._revision is not None and 
+                    self._tryRevision() == self._revision)
+        self._writes.flush()
+
+        if unedited:
+            self._revision = self._tryRevision()
+        else:
+            self._revision = None
+        if self._cache_data is not None:
+            self._cache_data['revision'] = self._revision
+
+    @property
+    def streaming(self):
+        return self._config.getint('stream_window', fallback=0) > 0
+
+    def streamComponents(self, database, field_populators=[], validator=None, 
+                         search_category=None, seen=None):
+
+        # Streaming replacement for populateComponents and 
+        # addComponentsToDatabase, after readHeaders.  The tabs are read 
+        # stream_window rows at a time, and every window goes through a
+        # pipeline of generators: Component IDs and populators, ID and
+        # library checks, then the insert into the category (and search)
+        # table.  Up to read_workers windows are fetched ahead while earlier
+        # ones are in the pipeline, so memory is bounded by the window size
+        # rather than the library.  The tables must already exist, and be
+        # empty.  Returns the number of components loaded and of new IDs.
+        flush_size = self._config.getint('write_flush_size', fallback=500)
+
+        # Component IDs seen so far, to catch duplicates across windows (and
+        # across categories and spreadsheets, with a search table).
+        if seen is None:
+            seen = {}
+        counts = {'loaded': 0, 'assigned': 0}
+
+        self._openPopulatorCache(field_populators)
+
+        try:
+            windows = self._readWindows()
+            windows = self._populateWindows(windows, field_populators, counts)
+            windows = self._checkWindows(windows, seen, validator, 
+                                         search_category is not None)
+
+            for c, rows in windows:
+                counts['loaded'] += self._loadWindow(database, c, rows, 
+                                                     search_category)
+
+                # Written as they pile up, so they do not grow with the
+                # library either.
+                if len(self._writes) >= flush_size:
+                    self._flushWrites()
+
+        finally:
+            self._closePopulatorCache()
+
+        # The remaining IDs are written back before committing, as in
+        # addComponentsToDatabase.
+        self._flushWrites()
+        self.metrics.count('sheets_write_requests', self._writes.requests)
+        self.metrics.count('sheets_cells_written', self._writes.written)
+        self._countTransport()
+
+        database.commit()
+
+        print('')
+
+        return counts['loaded'], counts['assigned']
+
+    def _readWindows(self):
+        # Yield (category name, rows) for every window of every tab, in
+        # order, with the rows as a ColumnStore that is also set as the
+        # category's raw_rows (and first_row its sheet row).  Only the rows
+        # up to the last used one of each tab are read.
+        window_size = self._config.getint('stream_window', fallback=0)
+        prefetch = self._transport.concurrency
+
+        extents = self._readExtents()
+        windows = [(c, first_row) for c in self.categories 
+                   for first_row in range(2, extents[c] + 1, window_size)]
+
+        def fetch(window):
+            c, first_row = window
+            rows = self._request('sheets_read_requests', 'read', 
+                self._sheet.values().get(spreadsheetId=self._config['sheet_id'],
+                    range='%s!%i:%i' % (GSheetReader.categoryRange(c), 
+                                        first_row, first_row + window_size - 1))
+                ).get('values', [])
+            self._countFetched(rows)
+            return rows
+
+        with ThreadPoolExecutor(max_workers=prefetch) as pool:
+            pending = deque()
+            previous = None
+
+            for i in range(len(windows)):
+                while len(pending) <= prefetch and i + len(pending) < len(windows):
+                    pending.append(pool.submit(fetch, windows[i + len(pending)]))
+
+                c, first_row = windows[i]
+                category = self.categories[c]
+                if previous is not None and previous != c:
+                    # Only the current window of a category is ever held.
+                    self.categories[previous].raw_rows = None
+                previous = c
+
+                category.raw_rows = ColumnStore(pending.popleft().result())
+                category.first_row = first_row
+                yield c, category.raw_rows
+
+            if previous is not None:
+                self.categories[previous].raw_rows = None
+
+    def _populateWindows(self, windows, field_populators, counts):
+        row_populators = [f for f in field_populators 
+                          if not isinstance(f, BatchPopulator)]
+
+        for c, rows in windows:
+            counts['assigned'] += self._populateCategory(c, row_populators)
+
+            for f in field_populators:
+                if isinstance(f, BatchPopulator):
+                    self._runBatchPopulator(f, [c])
+
+            yield c, rows
+
+    def _checkWindows(self, windows, seen, validator=None, 
+                      across_categories=True):
+        for c, rows in windows:
+            checkComponentIds(self.categories[c], seen, across_categories)
+
+            if validator is not None:
+                validator.validateCategory(self.categories[c])
+
+            yield c, rows
+
+    def _loadWindow(self, database, c, rows, search_category=None):
+        if search_category is not None:
+            database.loadRows(search_category.name,
+                [f.database_name for f in search_category.fields],
+                search_category.category_rows(self.categories[c]))
+
+        component_rows = [r for r in rows if len(r) > 0]
+
+        database.loadRows(c, 
+            [f.database_name for f in self.categories[c].fields], 
+            component_rows)
+
+        return len(component_rows)
+
+    def _mapCategories(self, function, workers):
+        if workers > 1 and len(self.categories) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                return list(pool.map(function, self.categories))
+        return [function(c) for c in self.categories]
+
+    def _populateCategory(self, c, field_populators):
+
+        new_id_count = 0
+
+        parts_rows = self.categories[c].raw_rows
+        componet_id_index = self.categories[c].field_index('component_id')
+
+        component_ids = parts_rows.column(componet_id_index)
+
+        for row_index in parts_rows.nonEmptyRows():
+            if component_ids[row_index] == '':
+                new_uuid = uuid.uuid4()
+                row_number = row_index + self.categories[c].first_row
+                self._writes.add(c, row_number, componet_id_index, 
+                                 str(new_uuid))
+
+                print(colored('\n -> Assigned Component ID "%s" for row %i in category "%s"' 
+                        % (new_uuid, row_number, c), 'green'), end='', flush=True)
+
+                parts_rows.set(row_index, componet_id_index, str(new_uuid))
+                new_id_count += 1
+
+        for f in field_populators:
+            self._runRowPopulator(c, f)
+
+        return new_id_count
+
+    def _cacheFor(self, populator):
+        # The populator cache, the time to live of the populator's entries
+        # and the name they are keyed by, or Nones when its results are not
+        # cached.  Populators can set cache_ttl to shorten the time to live,
+        # or 0 to never be cached.
+        ttl = getattr(populator, 'cache_ttl', None)
+        name = self._populator_names.get(id(populator))
+        if self._populator_cache is None or ttl == 0 or name is None:
+            return None, None, None
+        return self._populator_cache, ttl, name
+
+    def _runRowPopulator(self, c, populator):
+
+        category = self.categories[c]
+        parts_rows = category.raw_rows
+        row_indexes = parts_rows.nonEmptyRows()
+
+        cache, ttl, name = self._cacheFor(populator)
+        if cache is not None:
+            # The populator sees the category and the whole row, so the key
+            # covers all of them.
+            header = [c] + [f.altium_name for f in category.fields]
+            rows = [parts_rows[i] for i in row_indexes]
+            keys = [PopulatorCache.key(name, header + r) for r in rows]
+            cached = cache.getMany(name, keys, ttl)
+            results = []
+
+        for n in range(len(row_indexes)):
+            row_index = row_indexes[n]
+
+            if cache is not None and keys[n] in cached:
+                val, update_index = cached[keys[n]]
+            else:
+                row = rows[n] if cache is not None else parts_rows[row_index]
+                val, update_index = populator(category, row)
+                if cache is not None:
+                    results.append((keys[n], [val, update_index]))
+
+            # Unchanged cells are not written back, so the sheet revision
+            # (and the sheet cache) only changes when a value does.
+            if (update_index >= 0 and 
+                    parts_rows.cell(row_index, update_index) != str(val)):
+                self._setCell(c, row_index, update_index, str(val))
+
+        if cache is not None:
+            cache.putMany(results)
+
+    def _setCell(self, c, row_index, column_index, value):
+        # Update a cell of a component, both in the sheet and in the rows
+        # that get loaded into the database.
+        self._writes.add(c, row_index + self.categories[c].first_row, 
+                         column_index, value)
+        self.categories[c].raw_rows.set(row_index, column_index, value)
+
+    def _runBatchPopulator(self, populator, category_names=None):
+
+        cache, ttl, name = self._cacheFor(populator)
+
+        # (category, output column, row indexes, input columns) per batch.
+        batches = []
+        # (category, output column, row index, value) of every component
+        # with a value, from the cache or the populator.
+        values = []
+        # Cache keys of the components sent to the populator.
+        keys = {}
+
+        if category_names is None:
+            category_names = list(self.categories)
+
+        for c in category_names:
+            category = self.categories[c]
+
+            # Fields are named as in the sheet, without the * and ^ markers.
+            by_name = dict((category.fields[i].altium_name, i) 
+                           for i in range(len(category.fields)))
+            output_index = by_name.get(populator.output_field, -1)
+            if output_index < 0:
+                continue
+
+            input_indexes = [by_name.get(f, -1) for f in populator.input_fields]
+            row_indexes = category.raw_rows.nonEmptyRows()
+
+            if cache is not None:
+                # Only components whose inputs were not seen before go to
+                # the populator.
+                row_keys = dict((i, PopulatorCache.key(name, 
+                    [category.raw_rows.cell(i, k) for k in input_indexes]))
+                    for i in row_indexes)
+                cached = cache.getMany(name, list(row_keys.values()), ttl)
+
+                for i in row_indexes:
+                    if row_keys[i] in cached:
+                        values.append((c, output_index, i, cached[row_keys[i]]))
+                    else:
+                        keys[(c, i)] = row_keys[i]
+                row_indexes = [i for i in row_indexes if (c, i) in keys]
+
+            for start in range(0, len(row_indexes), populator.batch_size):
+                batch = row_indexes[start:start + populator.batch_size]
+                columns = {}
+                for field, index in zip(populator.input_fields, input_indexes):
+                    columns[field] = category.raw_rows.column(index, batch)
+                batches.append((c, output_index, batch, columns))
+
+        workers = populator.max_workers
+        if workers is None:
+            workers = self._config.getint('populator_workers', fallback=4)
+
+        def populate(b):
+            return populator.populate(self.categories[b[0]], b[3])
+
+        if workers > 1 and len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(populate, batches))
+        else:
+            results = [populate(b) for b in batches]
+
+        new_entries = []
+
+        for (c, output_index, batch, columns), batch_values in zip(batches, results):
+            if batch_values is None:
+                batch_values = [None] * len(batch)
+            if len(batch_values) != len(batch):
+                raise Exception('Populator %s returned %i values for %i '
+                                'components in category "%s".' % (
+                                populator.name, len(batch_values), len(batch), c))
+
+            for row_index, value in zip(batch, batch_values):
+                values.append((c, output_index, row_index, value))
+                if cache is not None:
+                    new_entries.append((keys[(c, row_index)], value))
+
+        if cache is not None:
+            cache.putMany(new_entries)
+
+        updates = 0
+
+        for c, output_index, row_index, value in values:
+            if value is None:
+                continue
+            # Unchanged cells are not written back.
+            rows = self.categories[c].raw_rows
+            if rows.cell(row_index, output_index) == str(value):
+                continue
+            self._setCell(c, row_index, output_index, str(value))
+            updates += 1
+
+        self.metrics.count('populator_batches', len(batches))
+        self.metrics.count('populator_updates', updates)
+
+        return updates
+
+    def _loadCategory(self, database, c):
+
+        component_rows = [r for r in self.categories[c].raw_rows if len(r) > 0]
+
+        database.loadRows(c, 
+            [f.database_name for f in self.categories[c].fields], 
+            component_rows)
+
+        return len(component_rows)
+
+
+class MultiSheetReader:
+
+    # Reads a library split over several spreadsheets (the sheet_id of the
+    # gsheet config being a JSON list), e.g. one per department or component
+    # family, to stay under the cell limit of a single spreadsheet.  Each
+    # spreadsheet has its own GSheetReader, and they are read side by side
+    # and merged into one set of categories, which must have unique names
+    # across all of them.  Component IDs follow the same rule as in one
+    # spreadsheet: unique within each category, and across every category
+    # of every spreadsheet when there is a search table (checked by the
+    # sync on the merged categories).  It stands in for a GSheetReader in
+    # the sync.
+
+    def __init__(self, gsheet_config, track_revision=False, sheets={}, 
+                 files={}):
+        # sheets and files map sheet IDs to stand in resources, as for
+        # GSheetReader.
+        # The shared transport belongs to this reader rather than to any of
+        # the spreadsheet readers, so only this one resets its statistics,
+        # never one reader while the others are using it.
+        self.readers = []
+        self._transport = SheetsTransport(self._execute, gsheet_config)
+
+        for sheet_id in sheetIds(gsheet_config):
+            self.readers.append(GSheetReader(
+                _sheetConfig(gsheet_config, sheet_id), track_revision, 
+                sheets.get(sheet_id), files.get(sheet_id), self._transport))
+
+        self.categories = {}
+        self.unchanged = False
+        self.metrics = SyncMetrics()
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, metrics):
+        self._metrics = metrics
+        for r in self.readers:
+            r.metrics = metrics
+
+    @property
+    def streaming(self):
+        return self.readers[0].streaming
+
+    def hasChanged(self):
+        return any(self._eachReader(lambda r: r.hasChanged()))
+
+    def readAndValidateCategories(self):
+        self._transport.resetStats()
+        self._eachReader(lambda r: r.readAndValidateCategories())
+        self._merge()
+
+        self.unchanged = all(r.unchanged for r in self.readers)
+
+        return len(self.categories)
+
+    def readHeaders(self):
+        self._transport.resetStats()
+        self._eachReader(lambda r: r.readHeaders())
+        self._merge()
+        self.unchanged = False
+
+        return len(self.categories)
+
+    def populateComponents(self, field_populators=[], workers=1):
+        # One spreadsheet at a time, as each already spreads its categories
+        # over the workers.
+        return sum(r.populateComponents(field_populators, workers) 
+                   for r in self.readers)
+
+    def addComponentsToDatabase(self, database, field_populators=[]):
+        return sum(r.addComponentsToDatabase(database, field_populators) 
+                   for r in self.readers)
+
+    def streamComponents(self, database, field_populators=[], validator=None, 
+                         search_category=None):
+        seen = {}
+        loaded = 0
+        assigned = 0
+
+        for r in self.readers:
+            counts = r.streamComponents(database, field_populators, validator, 
+                                        search_category, seen)
+            loaded += counts[0]
+            assigned += counts[1]
+
+        return loaded, assigned
+
+    def saveCache(self):
+        return all([r.saveCache() for r in self.readers])
+
+    def _execute(self, request):
+        # Every spreadsheet is read with the same service account, so the
+        # first reader's per-thread connections serve all of them.
+        return self.readers[0]._execute(request)
+
+    def _eachReader(self, function):
+        with ThreadPoolExecutor(max_workers=len(self.readers)) as pool:
+            return list(pool.map(function, self.readers))
+
+    def _merge(self):
+        # Every category becomes a table of the one library database, so the
+        # tab names must not repeat between spreadsheets.
+        self.categories = {}
+        sheet_ids = {}
+
+        for r in self.readers:
+            sheet_id = r._config['sheet_id']
+            for c in r.categories:
+                if c in self.categories:
+                    raise Exception(
+                        'Category "%s" is in both spreadsheet %s and %s. Rename '
+                        'one of the tabs.' % (c, sheet_ids[c], sheet_id))
+                self.categories[c] = r.categories[c]
+                sheet_ids[c] = sheet_id
+
+
+def sheetIds(gsheet_config):
+    # sheet_id is either a single ID or a JSON list of them.
+    sheet_id = gsheet_config['sheet_id'].strip()
+    if sheet_id.startswith('['):
+        sheet_ids = json.loads(sheet_id)
+    else:
+        sheet_ids = [sheet_id]
+
+    if len(sheet_ids) == 0:
+        raise Exception('No sheet_id in the gsheet config.')
+    if len(set(sheet_ids)) != len(sheet_ids):
+        raise Exception('The same sheet_id is listed twice in the gsheet config.')
+
+    return sheet_ids
+
+
+def removeCache(gsheet_config):
+    # Remove the saved copy of the spreadsheet(s), e.g. before the library
+    # tables are changed, so a sync that fails part way never leaves an
+    # unchanged revision in front of half loaded tables.  saveCache writes
+    # it again once a sync succeeded.
+    if sheetIds(gsheet_config) == [gsheet_config['sheet_id']]:
+        cache_files = [gsheet_config.get('cache_file', '')]
+    else:
+        cache_files = [_sheetConfig(gsheet_config, i).get('cache_file', '')
+                       for i in sheetIds(gsheet_config)]
+
+    for cache_file in cache_files:
+        if len(cache_file) > 0 and os.path.isfile(cache_file):
+            os.remove(cache_file)
+
+
+def _sheetConfig(gsheet_config, sheet_id):
+    # A copy of the gsheet config for one of several spreadsheets, each with
+    # its own cache file.
+    parser = configparser.ConfigParser(interpolation=None)
+    parser['gsheet'] = dict(gsheet_config)
+    parser['gsheet']['sheet_id'] = sheet_id
+
+    cache_file = parser['gsheet'].get('cache_file', '')
+    if len(cache_file) > 0:
+        root, extension = os.path.splitext(cache_file)
+        parser['gsheet']['cache_file'] = '%s.%s%s' % (root, sheet_id, extension)
+
+    return parser['gsheet']
+
+
+class SheetWriteBuffer:
+
+    def __init__(self, sheet, sheet_id, flush_size=500, transport=None):
+        self._sheet = sheet
+        self._sheet_id = sheet_id
+        self._flush_size = flush_size
+        self._transport = transport
+        # Pending values by cell range.
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.written = 0
+        self.requests = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def reset(self):
+        self._pending = {}
+        self.written = 0
+        self.requests = 0
+
+    def add(self, category_name, row_number, column_index, value):
+        # Categories can be processed on several threads at once.  Several
+        # populators can write the same cell, and only the last value is
+        # kept, as in the rows loaded into the database.
+        cell_range = '%s!%s%i' % (GSheetReader.categoryRange(category_name),
+                                  GSheetReader.columnName(column_index),
+                                  row_number)
+        with self._lock:
+            self._pending[cell_range] = {
+                'range': cell_range,
+                'values': [[value]]
+            }
+
+    def flush(self):
+        # Send the pending cells in as few batchUpdate calls as the flush size
+        # allows.  Returns the number of cells written.
+        # Each cell is pending at most once, so the requests do not overlap
+        # and can run in any order.
+        pending = list(self._pending.values())
+        count = len(pending)
+
+        requests = [self._sheet.values().batchUpdate(
+                        spreadsheetId=self._sheet_id,
+                        body={
+                            'valueInputOption': 'RAW',
+                            'data': pending[i:i + self._flush_size]
+                        }) for i in range(0, count, self._flush_size)]
+
+        if self._transport is None:
+            for r in requests:
+                r.execute()
+        else:
+            self._transport.gather('write', requests)
+        self.requests += len(requests)
+
+        self._pending = {}
+        self.written += count
+
+        return count
+
+
+def checkComponentIds(category, seen, across_categories=True):
+    # Add the Component IDs of the rows of category to seen, which maps them
+    # to their category.  Each category table has its own unique index, so
+    # IDs only need to be unique across categories when they all go into
+    # the search table as well.
+    c = category.name
+    index = category.field_index('component_id')
+    for component_id in category.raw_rows.column(index):
+        if component_id == '':
+            continue
+        key = component_id if across_categories else (c, component_id)
+        if seen.get(key) == c:
+            # Only when streaming, otherwise caught with the category.
+            raise Exception(
+                'Category "%s" has duplicate Component ID(s): %s. Clear the '
+                'Component ID of copied rows to assign new ones.'
+                % (c, [component_id]))
+        if key in seen:
+            raise Exception(
+                'Component ID "%s" is used in both category "%s" and '
+                '"%s". Clear the Component ID of copied rows to assign '
+                'new ones.' % (component_id, seen[key], c))
+        seen[key] = c
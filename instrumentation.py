@@ -0,0 +1,145 @@
+# MIT License
+#
+# Copyright 2021 Jonathan Nutzmann
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import json
+import os
+import threading
+import time
+
+
+class SyncMetrics:
+
+    # Timings and counters for a single sync.  Phases run one after the
+    # other, so starting a phase ends the previous one.  Counters can be
+    # updated from worker threads.
+
+    PROMETHEUS_PREFIX = 'altium_library_sync'
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.duration = None
+        self.status = 'running'
+        self.phases = {}
+        self.counters = {}
+
+        self._start = time.perf_counter()
+        self._phase = None
+        self._phase_start = None
+        self._lock = threading.Lock()
+
+    def phase(self, name):
+        now = time.perf_counter()
+
+        if self._phase is not None:
+            self.phases[self._phase] = (self.phases.get(self._phase, 0.0) + 
+                                        now - self._phase_start)
+
+        self._phase = name
+        self._phase_start = now
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def setCounter(self, name, value):
+        with self._lock:
+            self.counters[name] = value
+
+    def finish(self, status):
+        self.phase(None)
+        self.duration = time.perf_counter() - self._start
+        self.status = status
+
+    def asDict(self):
+        return {
+            'start_time': self.start_time,
+            'duration': self.duration,
+            'status': self.status,
+            'phases': self.phases,
+            'counters': self.counters
+        }
+
+    def printSummary(self):
+        print('Sync took %.1f s (%s).' % (self.duration, ', '.join(
+            '%s %.2f s' % (p, self.phases[p]) for p in self.phases)))
+        print('      %i Sheets reads (%i cells, %i bytes), %i Sheets writes '
+              '(%i cells), %i SQL statements (%i rows), %i of %i libraries '
+              'read.' % (
+              self.counters.get('sheets_read_requests', 0) + 
+              self.counters.get('sheets_metadata_requests', 0),
+              self.counters.get('sheets_cells_fetched', 0),
+              self.counters.get('sheets_bytes_fetched', 0),
+              self.counters.get('sheets_write_requests', 0),
+              self.counters.get('sheets_cells_written', 0),
+              self.counters.get('sql_statements', 0),
+              self.counters.get('sql_rows', 0),
+              self.counters.get('library_files_parsed', 0),
+              self.counters.get('library_files', 0)))
+
+        hits = self.counters.get('populator_cache_hits', 0)
+        lookups = hits + self.counters.get('populator_cache_misses', 0)
+        if lookups > 0:
+            print('      Populator cache: %i of %i lookups hit (%.1f%%).' 
+                  % (hits, lookups, 100.0 * hits / lookups))
+
+    def writeRecord(self, filename):
+        # Written to a temporary file first so readers never see a partial
+        # record.
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(self.asDict(), f, indent=2)
+        os.replace(filename + '.tmp', filename)
+
+    def writePrometheus(self, filename):
+        # Text format for the node_exporter textfile collector, which also
+        # needs the file to be replaced atomically.
+        prefix = SyncMetrics.PROMETHEUS_PREFIX
+        lines = []
+
+        def gauge(name, help_text, samples):
+            lines.append('# HELP %s_%s %s' % (prefix, name, help_text))
+            lines.append('# TYPE %s_%s gauge' % (prefix, name))
+            for labels, value in samples:
+                lines.append('%s_%s%s %s' % (prefix, name, labels, 
+                                             _prometheusValue(value)))
+
+        gauge('last_run_timestamp_seconds', 'Start time of the last sync.',
+              [('', self.start_time)])
+        gauge('success', 'Whether the last sync succeeded.',
+              [('', 0 if self.status.startswith('error') else 1)])
+        gauge('duration_seconds', 'Duration of the last sync.',
+              [('', self.duration or 0)])
+        gauge('phase_duration_seconds', 'Duration of each phase of the last sync.',
+              [('{phase="%s"}' % p, self.phases[p]) for p in self.phases])
+        for c in sorted(self.counters):
+            gauge(c, 'Value of the %s counter in the last sync.' % c,
+                  [('', self.counters[c])])
+
+        with open(filename + '.tmp', 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(filename + '.tmp', filename)
+
+
+def _prometheusValue(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
@@ -21,11 +21,20 @@
 # SOFTWARE.
 
 
+import hashlib
+import json
+
 from .altium import ALTIUM_SPECIAL_FIELDS
+from .column_store import ColumnStore
 
 
 class Category:
 
+    # Large libraries hold hundreds of thousands of these rows, so the rows
+    # are kept in a ColumnStore and the classes have no __dict__.
+    __slots__ = ('name', 'row_count', 'fields', 'link_counts', 'raw_rows', 
+                 'first_row', '_field_indexes')
+
     def __init__(self, name, row_count):
        
         self.name = name
@@ -33,6 +42,10 @@ class Category:
         self.fields = []
         self.link_counts = 0
         self.raw_rows = None
+        # Sheet row of raw_rows[0], after the header row unless the rows are
+        # streamed a window at a time.
+        self.first_row = 2
+        self._field_indexes = {}
 
 
     def add_field(self, field):
@@ -40,6 +53,9 @@ class Category:
         if field.link:
             self.link_counts += 1
             field.link_index = self.link_counts
+            field.database_name = 'ComponentLink%iURL' % field.link_index
+        # The first field wins if a name is repeated.
+        self._field_indexes.setdefault(field.database_name, len(self.fields))
         self.fields.append(field)
 
 
@@ -64,34 +80,245 @@ class Category:
 
     def field_index(self, field_database_name):
 
+        return self._field_indexes.get(field_database_name, -1)
+
+
+    def column_lengths(self):
+
+        # Longest value seen in each field, used to size the table columns.
+        # Only the distinct values of each column need to be measured.
+        lengths = [0] * len(self.fields)
+
+        if self.raw_rows is not None:
+            for i in range(len(lengths)):
+                lengths[i] = max(map(len, self.raw_rows.distinctValues(i)), 
+                                 default=0)
+
+        return lengths
+
+
+    def table_schema(self, indexed_fields=[]):
+
+        # Dialect neutral description of the table, which the database
+        # backends turn into their own CREATE TABLE syntax.  Columns (after
+        # the id column) are (name, type, default) tuples, and indexes are
+        # (kind, name, columns) tuples with (column, prefix length) pairs.
+        # Without rows (when they are streamed), columns are sized for any
+        # value.
+        if self.raw_rows is None:
+            lengths = None
+        else:
+            lengths = self.column_lengths()
+
+        columns = []
+
+        # Altium looks parts up by component_id, so it gets a unique index.
+        # Other indexes are configured by field name.
+        indexes = [('unique', 'component_id', [('component_id', None)])]
+
         for i in range(len(self.fields)):
-            if self.fields[i].database_name == field_database_name:
-                return i
-        return -1
+            f = self.fields[i]
+
+            if f.database_name == 'component_id':
+                columns.append(('component_id', 'CHAR(36)', None))
+                continue
+
+            if lengths is None:
+                sql_type = 'TEXT'
+            else:
+                sql_type = column_type(lengths[i])
+
+            if f.link:
+                columns.append(('ComponentLink%iDescription' % f.link_index,
+                                'CHAR(%i)' % len(f.altium_name), f.altium_name))
+
+            columns.append((f.database_name, sql_type, None))
+
+            if f.altium_name in indexed_fields:
+                # TEXT columns can only be indexed by a prefix.
+                indexes.append(('index', 'idx_%s' % f.database_name[:60], 
+                    [(f.database_name, 255 if sql_type == 'TEXT' else None)]))
+
+        return columns, indexes
 
 
     # TODO: make sure we sanitize inputs.
-    def generate_create_table(self):
-         
-        query = "CREATE TABLE `%s` (id INT NOT NULL AUTO_INCREMENT," % (self.name)
+    def table_definition(self, indexed_fields=[]):
 
-        for f in self.fields:
+        # The MariaDB table definition.
+        columns, indexes = self.table_schema(indexed_fields)
 
-            if f.database_name == 'component_id':
+        query = "(id INT NOT NULL AUTO_INCREMENT,"
+
+        for name, sql_type, default in columns:
+            if name == 'component_id':
                 query += 'component_id CHAR(36) CHARACTER SET ascii NOT NULL,'
-            elif f.link:
-                query += "ComponentLink%iDescription CHAR(%i) DEFAULT '%s'," \
-                    % (f.link_index, len(f.altium_name), f.altium_name)
-                query += 'ComponentLink%iURL VARCHAR(255),' % f.link_index
-                f.database_name = 'ComponentLink%iURL' % f.link_index
+            elif default is not None:
+                query += "`%s` %s DEFAULT '%s'," % (name, sql_type, 
+                                                   default.replace("'", "''"))
             else:
-                query += "`%s` VARCHAR(255)," % f.database_name
+                query += "`%s` %s," % (name, sql_type)
+
+        query += "PRIMARY KEY (id),"
 
-        query += "PRIMARY KEY (id));"
+        for kind, name, index_columns in indexes:
+            query += "%s `%s` (%s)," % (INDEX_KEYWORDS[kind], name, ','.join(
+                '`%s`' % c if prefix is None else '`%s`(%i)' % (c, prefix)
+                for c, prefix in index_columns))
+
+        query = query[:-1] + ")"
 
         return query
 
+
+    def schema_hash(self, indexed_fields=[]):
+        # Hashed from the dialect neutral schema, so it is the same whichever
+        # backend the table was created in.  Column sizes and index prefixes
+        # follow the data rather than the header row, so they are left out:
+        # an incremental sync widens columns in place instead of rebuilding
+        # the table.
+        columns, indexes = self.table_schema(indexed_fields)
+        return hashlib.sha1(json.dumps([
+            [(name, default) for name, sql_type, default in columns],
+            [(kind, name, [c for c, prefix in index_columns])
+             for kind, name, index_columns in indexes]
+        ]).encode()).hexdigest()
+
+
+    def generate_create_table(self, table_name=None, indexed_fields=[]):
+
+        if table_name is None:
+            table_name = self.name
+
+        # The schema hash is kept in the table comment so that an incremental
+        # sync can tell whether the header row changed since the table was
+        # created.
+        return "CREATE TABLE `%s` %s COMMENT='schema:%s';" % (
+            table_name, self.table_definition(indexed_fields), 
+            self.schema_hash(indexed_fields))
+
+
+    def find_duplicate_component_ids(self):
+
+        index = self.field_index('component_id')
+        seen = set()
+        duplicates = []
+
+        if self.raw_rows is None:
+            return duplicates
+
+        for component_id in self.raw_rows.column(index):
+            if component_id == '':
+                continue
+            if component_id in seen:
+                duplicates.append(component_id)
+            seen.add(component_id)
+
+        return duplicates
+
+
+class SearchCategory(Category):
+
+    # A denormalized table holding the key fields of every component in every
+    # category, with a FULLTEXT index, so a part can be found with a single
+    # query instead of one per category table.  It keeps the Altium fields,
+    # so parts can also be placed straight from it.
+
+    BASE_FIELDS = ['Category', 'Component ID'] + ALTIUM_SPECIAL_FIELDS + \
+                  ['Manufacturer Part Number']
+
+    # Fields that identify files or IDs rather than describe the part.
+    UNSEARCHED_FIELDS = ['Category', 'Component ID', 'Library Ref', 
+                         'Library Path', 'Footprint Ref', 'Footprint Path']
+
+    __slots__ = ()
+
+    def __init__(self, name, categories, search_fields=[]):
+
+        super().__init__(name, 0)
+
+        field_names = SearchCategory.BASE_FIELDS + [f for f in search_fields 
+                        if f not in SearchCategory.BASE_FIELDS]
+        for f in field_names:
+            self.add_field(Field(f))
+
+        if any(c.raw_rows is None for c in categories.values()):
+            # The categories are streamed, so their rows are added to the
+            # table a window at a time with category_rows.
+            return
+
+        # Built a column at a time from the category stores.
+        columns = [[] for f in field_names]
+
+        for c in categories.values():
+            for column, values in zip(columns, self.category_columns(c)):
+                column += values
+
+        self.raw_rows = ColumnStore.fromColumns(columns)
+        self.row_count = len(self.raw_rows)
+
+
+    def category_columns(self, category):
+
+        # The columns of this table for the components of one category.
+        by_name = dict((category.fields[i].altium_name, i) 
+                       for i in range(len(category.fields)))
+        row_indexes = category.raw_rows.nonEmptyRows()
+
+        return [[category.name] * len(row_indexes)] + [
+            category.raw_rows.column(by_name.get(f.altium_name, -1), row_indexes) 
+            for f in self.fields[1:]]
+
+
+    def category_rows(self, category):
+
+        return ColumnStore.fromColumns(self.category_columns(category))
+
+
+    def table_schema(self, indexed_fields=[]):
+
+        columns, indexes = Category.table_schema(self, indexed_fields)
+
+        indexes.append(('fulltext', 'search', [(f.database_name, None) 
+            for f in self.fields 
+            if f.altium_name not in SearchCategory.UNSEARCHED_FIELDS]))
+
+        return columns, indexes
+
+
+INDEX_KEYWORDS = {
+    'unique': 'UNIQUE KEY',
+    'index': 'KEY',
+    'fulltext': 'FULLTEXT KEY'
+}
+
+
+def column_type(length):
+
+    # Round the observed length up to a few fixed sizes, so that small changes
+    # in the data do not change the schema (and force an incremental sync to
+    # rebuild the table).  Values too long for VARCHAR(255) get TEXT.
+    for size in [16, 32, 64, 128, 255]:
+        if length <= size:
+            return 'VARCHAR(%i)' % size
+    return 'TEXT'
+
+
+def column_width(sql_type):
+
+    # Longest value a column sized by column_type holds, or None for the
+    # fixed size columns.
+    if sql_type == 'TEXT':
+        return 65535
+    if sql_type.startswith('VARCHAR('):
+        return int(sql_type[len('VARCHAR('):-1])
+    return None
+
+
 class Field:
+
+    __slots__ = ('altium_name', 'database_name', 'visibleOnAdd', 'link', 
+                 'link_index')
     
     def __init__(self, sheet_name):
         self.altium_name = sheet_name.strip().replace('*','').replace('^','')
@@ -100,6 +327,11 @@ class Field:
         self.link = sheet_name.find('^') > -1
         self.link_index = -1
 
+    def sheet_header(self):
+        # A header that gives back this field, markers included.
+        return (self.altium_name + ('*' if self.visibleOnAdd else '') +
+                ('^' if self.link else ''))
+
     def __repr__(self) -> str:
         return ("%s (%s) - %s, %s" % (self.database_name, self.altium_name, 
                                       self.visibleOnAdd, self.link))
\ No newline at end of file
@@ -0,0 +1,117 @@
+# MIT License
+#
+# Copyright 2021 Jonathan Nutzmann
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+class PopulatorCache:
+
+    # Remembers field populator results between syncs in a SQLite file.
+    # Entries are keyed by the populator's name and a hash of the cells it
+    # was given, expire after ttl seconds, and the least recently used ones
+    # are dropped once there are more than max_entries.
+
+    LOOKUP_CHUNK = 500
+
+    def __init__(self, filename, ttl=604800, max_entries=100000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = {}
+
+        self._conn = sqlite3.connect(filename, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS populator_cache ('
+                           'key TEXT PRIMARY KEY, value TEXT, created REAL, '
+                           'used REAL)')
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(populator_name, cells):
+        h = hashlib.sha1(populator_name.encode())
+        h.update(b'\x1e')
+        h.update('\x1f'.join(cells).encode())
+        return h.hexdigest()
+
+    def getMany(self, populator_name, keys, ttl=None):
+        # Return {key: value} for the keys with a live entry.
+        if ttl is None:
+            ttl = self.ttl
+        now = time.time()
+        found = {}
+
+        with self._lock:
+            unique_keys = list(set(keys))
+            for i in range(0, len(unique_keys), PopulatorCache.LOOKUP_CHUNK):
+                chunk = unique_keys[i:i + PopulatorCache.LOOKUP_CHUNK]
+                for key, value in self._conn.execute(
+                        'SELECT key, value FROM populator_cache WHERE '
+                        'created > ? AND key IN (%s)' % ','.join('?' * len(chunk)),
+                        [now - ttl] + chunk):
+                    found[key] = json.loads(value)
+
+            self._conn.executemany('UPDATE populator_cache SET used = ? '
+                                   'WHERE key = ?', [(now, k) for k in found])
+
+            stats = self.stats.setdefault(populator_name, [0, 0])
+            hits = sum(1 for k in keys if k in found)
+            stats[0] += hits
+            stats[1] += len(keys) - hits
+
+        return found
+
+    def putMany(self, items):
+        # items is a list of (key, value) pairs.
+        now = time.time()
+        rows = []
+        for key, value in items:
+            try:
+                rows.append((key, json.dumps(value), now, now))
+            except (TypeError, ValueError):
+                # Results that cannot be stored are simply not cached.
+                pass
+
+        with self._lock:
+            self._conn.executemany('INSERT OR REPLACE INTO populator_cache '
+                                   'VALUES (?, ?, ?, ?)', rows)
+
+    def hitCounts(self):
+        hits = sum(s[0] for s in self.stats.values())
+        misses = sum(s[1] for s in self.stats.values())
+        return hits, misses
+
+    def save(self):
+        # Drop expired and least recently used entries, and commit.
+        with self._lock:
+            self._conn.execute('DELETE FROM populator_cache WHERE created <= ?',
+                               (time.time() - self.ttl,))
+            self._conn.execute('DELETE FROM populator_cache WHERE key IN ('
+                               'SELECT key FROM populator_cache ORDER BY used '
+                               'DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+            self._conn.commit()
+
+    def close(self):
+        self._conn.close()
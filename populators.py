@@ -0,0 +1,79 @@
+# MIT License
+#
+# Copyright 2021 Jonathan Nutzmann
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import functools
+
+
+class BatchPopulator:
+
+    # Base class for field populators that fill in a column for many
+    # components with one call, e.g. looking up a batch of part numbers at a
+    # distributor, instead of being called once per row like a plain
+    # populator function.
+    #
+    # Subclasses set input_fields and output_field (by their names in the
+    # sheet) and implement populate.  Every category with the output field is
+    # split into batches of up to batch_size components, and the batches run
+    # on a pool of max_workers threads (populator_workers from the gsheet
+    # config if None), so I/O bound lookups overlap.
+
+    input_fields = []
+    output_field = None
+    batch_size = 100
+    max_workers = None
+
+    # With a populator_cache in the gsheet config, results are cached by the
+    # input values, so populate must not depend on anything else.  Set this
+    # to shorten how long they are kept, or to 0 to never cache them.
+    cache_ttl = None
+
+    @property
+    def name(self):
+        return type(self).__name__
+
+    def populate(self, category, columns):
+        # columns maps each input field to its values for the batch, one per
+        # component, in row order.  Return a list of as many new output
+        # values, with None for cells that should be left as they are.
+        raise NotImplementedError()
+
+
+def populatorName(populator):
+    # Stable name of a populator function, callable object or BatchPopulator,
+    # used to key its cached results, or None if it has no name that tells
+    # it apart from other populators across runs.  Lambdas, nested functions
+    # and partials all share names, so they need a name attribute set to be
+    # cached.
+    name = getattr(populator, 'name', None)
+    if isinstance(name, str):
+        return name
+
+    if isinstance(populator, functools.partial):
+        return None
+
+    qualname = getattr(populator, '__qualname__', type(populator).__qualname__)
+    if '<lambda>' in qualname or '<locals>' in qualname:
+        return None
+
+    module = getattr(populator, '__module__', type(populator).__module__)
+    return '%s.%s' % (module, qualname)
@@ -0,0 +1,161 @@
+# MIT License
+#
+# Copyright 2021 Jonathan Nutzmann
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import random
+import threading
+import time
+
+
+class TokenBucket:
+
+    # Paces requests to a per-minute quota.  Tokens refill continuously and
+    # at most burst can be saved up, so a quiet spell does not turn into a
+    # burst that the quota window would reject.  Waiting requests reserve
+    # tokens ahead (the count goes negative), so they are served in order.
+
+    def __init__(self, per_minute, burst):
+        self._rate = per_minute / 60.0
+        self._capacity = max(1, burst)
+        self._tokens = float(self._capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        # Take a token, returning the seconds to wait until it is ours.
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, 
+                               self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            self._tokens -= 1
+
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self._rate
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+
+class SheetsTransport:
+
+    # Runs Google API requests with asyncio: every request waits for a token
+    # from the read or write bucket, runs on a worker thread (the API client
+    # blocks, and the threads are kept so their HTTP connections are reused),
+    # and is retried with exponential backoff and jitter when
+    # Google answers 429 (quota) or a 5xx error.  Independent requests, like
+    # the reads of separate tabs, run side by side up to a concurrency limit.
+
+    RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+    def __init__(self, execute, gsheet_config):
+        # execute(request) performs a single request on the calling thread.
+        self._execute = execute
+        self._buckets = {
+            'read': TokenBucket(
+                gsheet_config.getfloat('read_requests_per_minute', fallback=60),
+                gsheet_config.getint('request_burst', fallback=10)),
+            'write': TokenBucket(
+                gsheet_config.getfloat('write_requests_per_minute', fallback=60),
+                gsheet_config.getint('request_burst', fallback=10))
+        }
+        self.concurrency = max(1, gsheet_config.getint('read_workers', 
+                                                       fallback=4))
+        self._max_retries = gsheet_config.getint('max_retries', fallback=5)
+        self._backoff = gsheet_config.getfloat('retry_backoff', fallback=1.0)
+        self._max_backoff = gsheet_config.getfloat('max_retry_backoff', 
+                                                   fallback=64)
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency,
+                                        thread_name_prefix='sheets')
+        self._lock = threading.Lock()
+        self.resetStats()
+
+    def resetStats(self):
+        self.retries = 0
+        self.throttle_seconds = 0.0
+
+    def execute(self, kind, request):
+        return asyncio.run(self.request(kind, request))
+
+    def gather(self, kind, requests):
+        # Run requests concurrently and return their responses in order.
+        if len(requests) == 0:
+            return []
+        return asyncio.run(self._gather(kind, requests))
+
+    async def _gather(self, kind, requests):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def limited(request):
+            async with semaphore:
+                return await self.request(kind, request)
+
+        return await asyncio.gather(*[limited(r) for r in requests])
+
+    async def request(self, kind, request):
+        attempt = 0
+
+        while True:
+            waited = await self._buckets[kind].acquire()
+            with self._lock:
+                self.throttle_seconds += waited
+
+            try:
+                return await asyncio.get_running_loop().run_in_executor(
+                    self._pool, self._execute, request)
+            except Exception as e:
+                status = _status(e)
+                if status not in SheetsTransport.RETRY_STATUSES or \
+                        attempt >= self._max_retries:
+                    raise
+
+                delay = min(self._max_backoff, self._backoff * 2 ** attempt)
+                delay = max(delay * random.uniform(0.5, 1.0), _retryAfter(e))
+                attempt += 1
+                with self._lock:
+                    self.retries += 1
+
+                await asyncio.sleep(delay)
+
+
+def _status(error):
+    # The HTTP status of a googleapiclient HttpError (or anything shaped like
+    # one), None for other errors.
+    resp = getattr(error, 'resp', None)
+    try:
+        return int(getattr(resp, 'status', None))
+    except (TypeError, ValueError):
+        return None
+
+
+def _retryAfter(error):
+    resp = getattr(error, 'resp', None)
+    try:
+        return float(resp.get('retry-after', 0))
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
@@ -0,0 +1,199 @@
+# MIT License
+#
+# Copyright 2021 Jonathan Nutzmann
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import gzip
+import hashlib
+import json
+import os
+import time
+
+from .column_store import ColumnStore
+from .models import Category, Field
+
+
+class SnapshotStore:
+
+    # Snapshots of the library as loaded by a sync, to restore the database
+    # without reading the Google sheet again.  Every category (its header and
+    # rows) and the DbLib are stored as gzipped objects named by the SHA-256
+    # of their content:
+    #
+    #   <directory>/objects/ab/abcdef....gz
+    #   <directory>/snapshots/<snapshot id>.json
+    #
+    # so a category that did not change between syncs is stored only once.
+    # A snapshot is a small manifest listing its objects, and its ID is the
+    # hash of that list, so syncing the same library twice gives the same
+    # snapshot.
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.objects_written = 0
+
+    def save(self, categories, dblib_content, sheet_ids=[]):
+        self.objects_written = 0
+        objects = []
+        components = 0
+
+        for c in categories:
+            category = categories[c]
+            content = {
+                'name': category.name,
+                'row_count': category.row_count,
+                'header': [f.sheet_header() for f in category.fields],
+                'rows': list(category.raw_rows)
+            }
+            objects.append([c, self._writeObject(json.dumps(content, 
+                separators=(',', ':')).encode('utf-8'))])
+            components += len(category.raw_rows.nonEmptyRows())
+
+        dblib = self._writeObject(dblib_content.encode('utf-8'))
+
+        snapshot_id = hashlib.sha256(json.dumps([objects, dblib], 
+            separators=(',', ':')).encode('utf-8')).hexdigest()
+        manifest = {
+            'id': snapshot_id,
+            'created': time.time(),
+            'sheet_ids': sheet_ids,
+            'components': components,
+            'categories': objects,
+            'dblib': dblib
+        }
+
+        # Saving the same library again only moves its snapshot to the top.
+        filename = self._manifestPath(snapshot_id)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(filename + '.tmp', filename)
+
+        return manifest
+
+    def listSnapshots(self):
+        # Newest first.
+        snapshots = []
+        directory = os.path.join(self.directory, 'snapshots')
+        if not os.path.isdir(directory):
+            return snapshots
+
+        for name in os.listdir(directory):
+            if name.endswith('.json'):
+                with open(os.path.join(directory, name), 'r') as f:
+                    snapshots.append(json.load(f))
+
+        snapshots.sort(key=lambda s: s['created'], reverse=True)
+
+        return snapshots
+
+    def resolve(self, snapshot_id):
+        # Snapshots can be named by any unique prefix of their ID.
+        matches = [s for s in self.listSnapshots() 
+                   if s['id'].startswith(snapshot_id)]
+
+        if len(snapshot_id) == 0 or len(matches) == 0:
+            raise Exception('No snapshot %s in %s.' 
+                            % (snapshot_id, self.directory))
+        if len(matches) > 1:
+            raise Exception('Snapshot %s is ambiguous, give more of its ID.' 
+                            % snapshot_id)
+
+        return matches[0]
+
+    def load(self, manifest):
+        # The categories of a snapshot, ready to be loaded into the database,
+        # and its DbLib.
+        categories = {}
+
+        for name, digest in manifest['categories']:
+            content = json.loads(self._readObject(digest).decode('utf-8'))
+
+            category = Category(content['name'], content['row_count'])
+            for h in content['header']:
+                category.add_field(Field(h))
+            category.raw_rows = ColumnStore(content['rows'])
+
+            categories[name] = category
+
+        dblib_content = self._readObject(manifest['dblib']).decode('utf-8')
+
+        return categories, dblib_content
+
+    def prune(self, keep):
+        # Remove all but the newest keep snapshots, and the objects only they
+        # used.  Returns the number of snapshots removed.  The newest is
+        # always kept.
+        keep = max(keep, 1)
+        snapshots = self.listSnapshots()
+
+        for s in snapshots[keep:]:
+            os.remove(self._manifestPath(s['id']))
+
+        used = set()
+        for s in snapshots[:keep]:
+            used.update(digest for name, digest in s['categories'])
+            used.add(s['dblib'])
+
+        directory = os.path.join(self.directory, 'objects')
+        for root, dirs, files in os.walk(directory):
+            for name in files:
+                if name[:-len('.gz')] not in used:
+                    os.remove(os.path.join(root, name))
+
+        return len(snapshots[keep:])
+
+    def _writeObject(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        filename = self._objectPath(digest)
+
+        if not os.path.isfile(filename):
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            # Level 6 is a few times faster than the default of 9 for a few
+            # percent more bytes, and mtime=0 keeps the compressed bytes the
+            # same for the same content.
+            with open(filename + '.tmp', 'wb') as f:
+                f.write(gzip.compress(data, compresslevel=6, mtime=0))
+            os.replace(filename + '.tmp', filename)
+            self.objects_written += 1
+
+        return digest
+
+    def _readObject(self, digest):
+        try:
+            with open(self._objectPath(digest), 'rb') as f:
+                data = gzip.decompress(f.read())
+        except OSError as e:
+            raise Exception('Snapshot object %s is missing or unreadable: %s' 
+                            % (digest, e))
+
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise Exception('Snapshot object %s is corrupt.' % digest)
+
+        return data
+
+    def _objectPath(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], 
+                            digest + '.gz')
+
+    def _manifestPath(self, snapshot_id):
+        return os.path.join(self.directory, 'snapshots', snapshot_id + '.json')
@@ -20,73 +20,593 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE 
 # SOFTWARE.
 
-#import argparse
+import argparse
+import cProfile
+import hashlib
+import json
+import os
+import random
+import time
+import traceback
 
-from .altium import generateDbLibFile, getLibraryFiles, fileValidator
-from .database import LibraryDatabase
-from .gsheet import GSheetReader
+from .altium import fileHash, generateDbLibFile, getLibraryFiles
+from .database import LibraryDatabase, getBackend
+from .gsheet import (GSheetReader, MultiSheetReader, checkComponentIds, 
+                     removeCache, sheetIds)
+from .instrumentation import SyncMetrics
+from .snapshots import SnapshotStore
 from .sync_config import SyncConfig
+from .validation import LibraryValidator
 
 
-def sync(config_file, field_populators=[]):
+def sync(config_file, field_populators=[], force=False):
 
     print('[1/8] Reading config file: %s' % config_file.name)
     sync_config = SyncConfig(config_file)
 
+    db = connectDatabase(sync_config)
+
+    try:
+        gsReader = connectGoogleSheet(sync_config)
+        runSync(sync_config, db, gsReader, field_populators, force)
+
+    finally:
+        db.close()
+        print('Done!! Closed DB connection.')
+
+
+def connectDatabase(sync_config):
+
     database_config = sync_config.get('database')
-    print('[2/8] Connecting to database %s@%s:%s (%s)... ' % 
-        (database_config['user'], database_config['host'],
-        database_config['port'], database_config['database']
-    ), end='', flush=True)
+    print('[2/8] Connecting to database %s... ' % 
+          getBackend(database_config).describe(), end='', flush=True)
     db = LibraryDatabase(database_config)
     print('Connected.')
 
+    return db
+
+
+def connectGoogleSheet(sync_config, track_revision=False):
+
+    gsheet_config = sync_config.get('gsheet')
+
+    print('[3/8] Connecting to Google sheet... ', end='', flush=True)
+    # A list of sheet IDs is merged into one library.
+    if sheetIds(gsheet_config) != [gsheet_config['sheet_id']]:
+        gsReader = MultiSheetReader(gsheet_config, 
+                                    track_revision=track_revision)
+    else:
+        gsReader = GSheetReader(gsheet_config, track_revision=track_revision)
+    print('Connected.')
+
+    return gsReader
+
+
+def runSync(sync_config, db, gsReader, field_populators=[], force=False):
+    # Run steps 4-8 of a sync over already open connections.  Returns False
+    # if the sheet was unchanged and nothing was done.  The timings and
+    # counters of the run are left in db.metrics (and gsReader.metrics).
+
+    metrics = SyncMetrics()
+    db.metrics = metrics
+    gsReader.metrics = metrics
+
     try:
-        print('[3/8] Connecting to Google sheet... ', end='', flush=True)
-        gsReader = GSheetReader(sync_config.get('gsheet'))
-        print('Connected.')
-       
-        print('[4/8] Reading & validating schema from Google sheet... ', 
-              end='', flush=True)
+        changed = _runSyncSteps(sync_config, db, gsReader, metrics, 
+                                field_populators, force)
+    except Exception as e:
+        metrics.finish('error: %s' % e)
+        writeMetrics(sync_config.get('metrics'), metrics)
+        raise
+
+    metrics.finish('ok' if changed else 'unchanged')
+    metrics.printSummary()
+    writeMetrics(sync_config.get('metrics'), metrics)
+
+    return changed
+
+
+def _runSyncSteps(sync_config, db, gsReader, metrics, field_populators=[], 
+                  force=False):
+
+    db.resetStats()
+
+    # When streaming, only the header rows are read up front, and the rows
+    # are read, populated, checked and loaded a window at a time in step 7.
+    streaming = gsReader.streaming
+    if streaming and db.sync_mode == 'incremental':
+        raise Exception('stream_window needs the recreate or shadow sync_mode, '
+                        'incremental syncs compare whole tables.')
+
+    metrics.phase('read')
+    print('[4/8] Reading & validating schema from Google sheet... ', 
+          end='', flush=True)
+    if streaming:
+        count = gsReader.readHeaders()
+    else:
         count = gsReader.readAndValidateCategories()
-        print('Found %i valid categories.' % count)
+    print('Found %i valid categories.' % count)
+
+    # IDs copied between categories would clash in the search table (the
+    # category tables only need them unique within each).
+    if not streaming and len(db.search_table) > 0:
+        seen = {}
+        for c in gsReader.categories:
+            checkComponentIds(gsReader.categories[c], seen)
+
+    # An unchanged sheet only means the library is up to date if the
+    # database still holds it, as configured now.
+    if gsReader.unchanged and not force:
+        library = dict(gsReader.categories)
+        search_category = db.buildSearchCategory(gsReader.categories)
+        if search_category is not None:
+            library[search_category.name] = search_category
+
+        if db.matchesSchema(library):
+            print('Google sheet is unchanged since the last sync, '
+                  'nothing to do.')
+            return False
+
+        print('      Google sheet is unchanged, but the database tables do not '
+              'match it, syncing anyway.')
+
+    # Populate before creating the schema, so the tables are sized for the
+    # values the populators add.
+    if not streaming:
+        metrics.phase('populate')
+        print('      Assigning Component IDs & populating fields... ', 
+              end='', flush=True)
+        count = gsReader.populateComponents(field_populators, db.pool_size)
+        print('Assigned %i new Component IDs.' % count)
 
+    # Every table in the library: the categories plus the search table.
+    tables = dict(gsReader.categories)
+    search_category = db.buildSearchCategory(gsReader.categories)
+    if search_category is not None:
+        tables[search_category.name] = search_category
+
+    metrics.phase('schema')
+    removeCache(sync_config.get('gsheet'))
+    createSchema(db, tables)
+
+    if streaming:
+        # The libraries are needed to check each window as it goes by.
+        metrics.phase('validate')
+        validator = createLibraryValidator(sync_config.get('altium'), metrics)
+
+    metrics.phase('load')
+    print('[7/8] Adding Components to database... ', end='', flush=True)
+    if streaming:
+        count, assigned = gsReader.streamComponents(db, field_populators, 
+                                                    validator, search_category)
+    else:
+        if search_category is not None:
+            # Loaded first so that it is committed along with the categories.
+            db.loadRows(search_category.name, 
+                        [f.database_name for f in search_category.fields],
+                        search_category.raw_rows)
+        count = gsReader.addComponentsToDatabase(db)
+    if db.load_seconds > 0:
+        rate = db.rows_loaded / db.load_seconds
+    else:
+        rate = 0
+    if streaming:
+        print('Added %i components to database and assigned %i new Component '
+              'IDs (%.0f rows/s).' % (count, assigned, rate))
+    elif db.sync_mode == 'incremental':
+        print('Synced %i components to database (%i inserted, %i updated, '
+              '%i deleted, %.0f rows/s).' % (count, db.rows_inserted, 
+              db.rows_updated, db.rows_deleted, rate))
+    else:
+        print('Added %i components to database (%.0f rows/s).' 
+              % (count, rate))
+
+    metrics.setCounter('rows_loaded', db.rows_loaded)
+    metrics.setCounter('rows_inserted', db.rows_inserted)
+    metrics.setCounter('rows_updated', db.rows_updated)
+    metrics.setCounter('rows_deleted', db.rows_deleted)
+
+    if db.sync_mode == 'shadow':
+        metrics.phase('swap')
+        print('      Swapping staging tables into place... ', 
+              end='', flush=True)
+        count = db.swapStagingTables(tables)
+        print('Swapped %i tables.' % count)
+
+    metrics.phase('validate')
+    print('      Validating symbols and footprints... ', end='', flush=True)
+    if streaming:
+        reportLibraryValidation(sync_config.get('altium'), validator)
+    else:
+        validator = validateLibraryReferences(sync_config.get('altium'), 
+                                              gsReader.categories, metrics)
+    for level, count in validator.counts().items():
+        metrics.setCounter('validation_%ss' % level, count)
+
+    metrics.phase('dblib')
+    print('[8/8] Updating DbLib file... ', end='', flush=True)
+    if generateDbLibFile(tables, db.getConnectionString(), 
+            sync_config.get('altium')['dblib_file'], db.getDbLibOptions()):
+        metrics.count('dblib_written')
+        print('Done.')
+    else:
+        print('Unchanged.')
+
+    metrics.phase('cache')
+    gsReader.saveCache()
+
+    # Streamed rows are gone once loaded, so there is nothing to snapshot.
+    if not streaming:
+        metrics.phase('snapshot')
+        saveSnapshot(sync_config, gsReader.categories, metrics)
+
+    return True
+
+
+def createSchema(db, tables):
+    # Steps 5 and 6: make empty tables for every table of the library, in the
+    # way the sync_mode loads them.
+    if db.sync_mode == 'incremental':
+        print('[5/8] Comparing library tables with Google sheet... ', 
+              end='', flush=True)
+        count = db.dropChangedTables(tables)
+        print('Dropped %i stale or changed tables.' % count)
+
+        print('[6/8] Creating new and changed schema... ', end='', flush=True)
+        count = db.createMissingTables(tables)
+        widened = db.widenColumns(tables)
+        print('Created %i new tables, widened %i columns.' % (count, widened))
+
+    elif db.sync_mode == 'shadow':
+        print('[5/8] Dropping leftover staging tables... ', end='', flush=True)
+        count = db.dropStagingTables()
+        print('Dropped %i tables.' % count)
+
+        print('[6/8] Creating new schema in staging tables... ', 
+              end='', flush=True)
+        count = db.createStagingTables(tables)
+        print('Created %i new tables.' % count)
+
+    else:
         print('[5/8] Droping current library tables... ', end='', flush=True)
         count = db.dropAllTables()
         print('Dropped %i tables.' % count)
 
         print('[6/8] Creating new schema... ', end='', flush=True)
-        for c in gsReader.categories:
-            query = gsReader.categories[c].generate_create_table()
-            db.execute(query)
-        print('Created %i new tables.' % len(gsReader.categories))
+        count = db.createTables(tables)
+        print('Created %i new tables.' % count)
+
+
+def validateLibraryReferences(altium_config, categories, metrics=None):
+
+    validator = createLibraryValidator(altium_config, metrics)
+    for c in categories:
+        validator.validateCategory(categories[c])
+    reportLibraryValidation(altium_config, validator)
+
+    return validator
+
+
+def createLibraryValidator(altium_config, metrics=None):
+
+    symbol_files, footprint_files = getLibraryFiles(altium_config, metrics)
+
+    return LibraryValidator(symbol_files, footprint_files)
+
+
+def reportLibraryValidation(altium_config, validator):
+
+    validator.printSummary()
+
+    report_file = altium_config.get('validation_report', '')
+    if len(report_file) > 0:
+        validator.writeReport(report_file)
 
-        symbol_files, footprint_files = getLibraryFiles(sync_config.get('altium'))
-        validator = [lambda a,b : fileValidator(symbol_files, footprint_files, a, b)]
 
-        print('[7/8] Adding Components to database... ', end='', flush=True)
-        count = gsReader.addComponentsToDatabase(db, 
-                    field_populators=(field_populators + validator))
-        print('Added %i components to database.' % count)
+def writeMetrics(metrics_config, metrics):
 
-        print('[8/8] Updating DbLib file... ', end='', flush=True)
-        generateDbLibFile(gsReader.categories, db.getConnectionString(), 
-        sync_config.get('altium')['dblib_file'])
+    record_file = metrics_config.get('run_record', '')
+    if len(record_file) > 0:
+        metrics.writeRecord(record_file)
+
+    prometheus_file = metrics_config.get('prometheus_file', '')
+    if len(prometheus_file) > 0:
+        metrics.writePrometheus(prometheus_file)
+
+
+def openSnapshotStore(snapshot_config):
+
+    directory = snapshot_config.get('directory', '')
+    if len(directory) == 0:
+        return None
+
+    return SnapshotStore(directory)
+
+
+def saveSnapshot(sync_config, categories, metrics=None):
+    # Keep the library as just loaded, with the DbLib written for it, so it
+    # can be restored later without the Google sheet.
+
+    snapshot_config = sync_config.get('snapshots')
+    store = openSnapshotStore(snapshot_config)
+    if store is None:
+        return None
+
+    print('      Saving snapshot... ', end='', flush=True)
+    with open(sync_config.get('altium')['dblib_file'], 'r') as f:
+        dblib_content = f.read()
+    manifest = store.save(categories, dblib_content, 
+                          sheetIds(sync_config.get('gsheet')))
+    count = store.prune(snapshot_config.getint('keep', fallback=30))
+    print('Saved %s (%i new objects), removed %i old snapshots.' 
+          % (manifest['id'][:12], store.objects_written, count))
+
+    if metrics is not None:
+        metrics.setCounter('snapshot_objects_written', store.objects_written)
+
+    return manifest
+
+
+def listSnapshots(config_file):
+
+    sync_config = SyncConfig(config_file)
+    store = openSnapshotStore(sync_config.get('snapshots'))
+    if store is None:
+        raise Exception('No directory in the snapshots section of the config '
+                        'file.')
+
+    for s in store.listSnapshots():
+        print('%s  %s  %6i components in %3i categories' % (s['id'][:12], 
+              time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(s['created'])),
+              s['components'], len(s['categories'])))
+
+
+def restore(config_file, snapshot_id):
+
+    print('[1/8] Reading config file: %s' % config_file.name)
+    sync_config = SyncConfig(config_file)
+
+    store = openSnapshotStore(sync_config.get('snapshots'))
+    if store is None:
+        raise Exception('No directory in the snapshots section of the config '
+                        'file.')
+    manifest = store.resolve(snapshot_id)
+
+    db = connectDatabase(sync_config)
+
+    try:
+        runRestore(sync_config, db, store, manifest)
+
+    finally:
+        db.close()
+        print('Done!! Closed DB connection.')
+
+
+def runRestore(sync_config, db, store, manifest):
+    # Load a snapshot into the database with steps 4-8 of a sync, reading
+    # the categories from the snapshot rather than the Google sheet.  The
+    # rows go through the same loadRows (and so bulk loads) and the shadow
+    # swap as in a sync.  The sheet cache is left alone if the restore
+    # succeeds: the next sync only loads the sheet again once it changes (or
+    # with --force).
+
+    metrics = SyncMetrics()
+    db.metrics = metrics
+
+    try:
+        _runRestoreSteps(sync_config, db, store, manifest, metrics)
+    except Exception as e:
+        # The tables may be half loaded, so the next sync must not skip an
+        # unchanged sheet.
+        removeCache(sync_config.get('gsheet'))
+        metrics.finish('error: %s' % e)
+        writeMetrics(sync_config.get('metrics'), metrics)
+        raise
+
+    metrics.finish('restored %s' % manifest['id'][:12])
+    metrics.printSummary()
+    writeMetrics(sync_config.get('metrics'), metrics)
+
+
+def _runRestoreSteps(sync_config, db, store, manifest, metrics):
+
+    db.resetStats()
+
+    metrics.phase('read')
+    print('[4/8] Reading snapshot %s of %s... ' % (manifest['id'][:12], 
+          time.strftime('%Y-%m-%d %H:%M:%S', 
+                        time.localtime(manifest['created']))), 
+          end='', flush=True)
+    categories, dblib_content = store.load(manifest)
+    print('Found %i categories.' % len(categories))
+
+    tables = dict(categories)
+    search_category = db.buildSearchCategory(categories)
+    if search_category is not None:
+        tables[search_category.name] = search_category
+
+    metrics.phase('schema')
+    createSchema(db, tables)
+
+    metrics.phase('load')
+    print('[7/8] Adding Components to database... ', end='', flush=True)
+    if search_category is not None:
+        db.loadRows(search_category.name, 
+                    [f.database_name for f in search_category.fields],
+                    search_category.raw_rows)
+    count = 0
+    for c in categories:
+        component_rows = [r for r in categories[c].raw_rows if len(r) > 0]
+        db.loadRows(c, [f.database_name for f in categories[c].fields], 
+                    component_rows)
+        count += len(component_rows)
+    db.commit()
+    if db.load_seconds > 0:
+        rate = db.rows_loaded / db.load_seconds
+    else:
+        rate = 0
+    print('Added %i components to database (%.0f rows/s).' % (count, rate))
+
+    metrics.setCounter('rows_loaded', db.rows_loaded)
+    metrics.setCounter('rows_inserted', db.rows_inserted)
+    metrics.setCounter('rows_updated', db.rows_updated)
+    metrics.setCounter('rows_deleted', db.rows_deleted)
+
+    if db.sync_mode == 'shadow':
+        metrics.phase('swap')
+        print('      Swapping staging tables into place... ', 
+              end='', flush=True)
+        count = db.swapStagingTables(tables)
+        print('Swapped %i tables.' % count)
+
+    # The DbLib is generated again for the current database connection,
+    # which gives the snapshot's DbLib unless the connection changed since.
+    metrics.phase('dblib')
+    print('[8/8] Updating DbLib file... ', end='', flush=True)
+    dblib_file = sync_config.get('altium')['dblib_file']
+    if generateDbLibFile(tables, db.getConnectionString(), dblib_file, 
+                         db.getDbLibOptions()):
+        metrics.count('dblib_written')
         print('Done.')
+    else:
+        print('Unchanged.')
+    if fileHash(dblib_file) != hashlib.sha1(dblib_content.encode()).hexdigest():
+        print('      The DbLib differs from the snapshot\'s, as the database '
+              'connection or options changed since.')
+
+
+def watch(config_file, field_populators=[]):
+    # Keep the database and Google sheet connections open and sync whenever
+    # the sheet changes.  The sheet revision is polled every interval seconds
+    # (plus or minus jitter), backing off exponentially while syncs fail.
+
+    print('[1/8] Reading config file: %s' % config_file.name)
+    sync_config = SyncConfig(config_file)
+    daemon_config = sync_config.get('daemon')
+
+    interval = daemon_config.getfloat('interval', fallback=300)
+    jitter = daemon_config.getfloat('jitter', fallback=0.1)
+    max_backoff = daemon_config.getfloat('max_backoff', fallback=3600)
+    status = SyncStatus(daemon_config.get('status_file', ''))
+
+    db = connectDatabase(sync_config)
+
+    try:
+        gsReader = connectGoogleSheet(sync_config, track_revision=True)
+        failures = 0
+
+        while True:
+            start = time.time()
+
+            try:
+                if failures > 0 or gsReader.hasChanged():
+                    db.ping()
+                    if runSync(sync_config, db, gsReader, field_populators):
+                        status.update('ok', start, time.time() - start)
+                    else:
+                        status.update('unchanged', start, time.time() - start)
+
+                failures = 0
+                delay = interval
+
+            except Exception as e:
+                traceback.print_exc()
+                db.rollback()
+                failures += 1
+                delay = min(interval * 2 ** failures, max_backoff)
+                status.update('error: %s' % e, start, time.time() - start)
+
+            delay *= 1 + random.uniform(-jitter, jitter)
+            print('Next check in %.0f seconds.' % delay)
+            time.sleep(delay)
+
+    except KeyboardInterrupt:
+        pass
 
     finally:
         db.close()
         print('Done!! Closed DB connection.')
 
 
-# if __name__ == "__main__":
+class SyncStatus:
+
+    def __init__(self, status_file=''):
+        self.status_file = status_file
+        self.last_sync_time = None
+        self.last_success_time = None
+        self.duration = None
+        self.status = 'starting'
+        self.sync_count = 0
+
+    def update(self, status, start, duration):
+        self.status = status
+        self.last_sync_time = start
+        self.duration = duration
+        self.sync_count += 1
+        if status == 'ok':
+            self.last_success_time = start
+
+        print('Last sync: %s (%s, %.1f s)' % (
+            time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start)),
+            status, duration))
+
+        if len(self.status_file) > 0:
+            # Write to a temporary file first so readers never see a partial
+            # status file.
+            with open(self.status_file + '.tmp', 'w') as f:
+                json.dump(self.asDict(), f, indent=2)
+            os.replace(self.status_file + '.tmp', self.status_file)
+
+    def asDict(self):
+        return {
+            'status': self.status,
+            'last_sync_time': self.last_sync_time,
+            'last_success_time': self.last_success_time,
+            'duration': self.duration,
+            'sync_count': self.sync_count
+        }
+
+
+if __name__ == "__main__":
 
-#     parser = argparse.ArgumentParser(
-#         description='Sync altium library from target gSheet.')
+    parser = argparse.ArgumentParser(
+        description='Sync altium library from target gSheet.')
 
-#     parser.add_argument('--config', type=argparse.FileType('r'), nargs='?',
-#                         metavar='c', default='config.ini',
-#                         help='Configuration file for sync.')
-#     args = parser.parse_args()
+    parser.add_argument('--config', type=argparse.FileType('r'), nargs='?',
+                        metavar='c', default='config.ini',
+                        help='Configuration file for sync.')
+    parser.add_argument('--force', action='store_true',
+                        help='Sync even if the sheet is unchanged.')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and sync whenever the sheet changes.')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='Profile a single sync with cProfile and save the '
+                             'stats to FILE (view them with pstats or '
+                             'snakeviz).')
+    parser.add_argument('--list-snapshots', action='store_true',
+                        help='List the saved snapshots of the library.')
+    parser.add_argument('--restore', metavar='SNAPSHOT',
+                        help='Load a saved snapshot (or a unique prefix of '
+                             'its ID) into the database, without reading the '
+                             'sheet.')
+    args = parser.parse_args()
 
-#     sync(args.config)
\ No newline at end of file
+    if args.list_snapshots:
+        listSnapshots(args.config)
+    elif args.restore is not None:
+        if args.watch or args.profile is not None:
+            parser.error('--restore only works on its own.')
+        restore(args.config, args.restore)
+    elif args.watch:
+        if args.profile is not None:
+            parser.error('--profile only works for a single sync.')
+        watch(args.config)
+    elif args.profile is not None:
+        profile = cProfile.Profile()
+        try:
+            profile.runcall(sync, args.config, force=args.force)
+        finally:
+            profile.dump_stats(args.profile)
+            print('Saved profile to %s.' % args.profile)
+    else:
+        sync(args.config, force=args.force)
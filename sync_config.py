@@ -25,11 +25,19 @@ import configparser
 
 class SyncConfig:
 
+    OPTIONAL_CATEGORIES = ['daemon', 'metrics', 'snapshots']
+
     def __init__(self, config_file):
         self._config = configparser.ConfigParser()
         self._config.read_file(config_file)
         self.validate()
 
+        # Optional categories only hold settings with defaults, so make sure
+        # they exist and can be read with fallbacks.
+        for c in SyncConfig.OPTIONAL_CATEGORIES:
+            if c not in self._config:
+                self._config.add_section(c)
+
     def print_config(self):
         for c in self._config:
             print(c)
@@ -48,6 +56,10 @@ class SyncConfig:
             'altium': ['dblib_file']
         }
 
+        # A SQLite library is a local file rather than a server.
+        if self._config.get('database', 'backend', fallback='mariadb') == 'sqlite':
+            require['database'] = ['path']
+
         for r in require:
             if r not in self._config:
                 raise Exception('Missing category %s in config file.' % r)
@@ -56,3 +68,8 @@ class SyncConfig:
                 if f not in self._config[r]:
                     raise Exception('Missing field %s in %s of config file.' 
                                     % (f,r))
+
+        # Pruning to no snapshots would also remove the one just saved.
+        if self._config.getint('snapshots', 'keep', fallback=30) < 1:
+            raise Exception('keep in snapshots of config file must be at '
+                            'least 1.')
@@ -0,0 +1,110 @@
+# MIT License
+#
+# Copyright 2021 Jonathan Nutzmann
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+from altium_gsheet_library.column_store import ColumnStore
+
+
+ROWS = [
+    ['R1', '10k', '0402'],
+    ['R2', '10k'],
+    [],
+    ['R3', '', '0402'],
+    ['C1', '100n', '0603', 'X7R']
+]
+
+
+def test_rows_come_back_as_they_went_in():
+    store = ColumnStore(ROWS)
+
+    assert len(store) == len(ROWS)
+    assert list(store) == ROWS
+    assert [store[i] for i in range(len(ROWS))] == ROWS
+    assert store[1:3] == ROWS[1:3]
+
+
+def test_iteration_crosses_chunks(monkeypatch):
+    monkeypatch.setattr(ColumnStore, 'CHUNK_SIZE', 2)
+
+    assert list(ColumnStore(ROWS)) == ROWS
+
+
+def test_repeated_values_are_stored_once():
+    store = ColumnStore(ROWS)
+
+    assert sorted(store.distinctValues(1)) == ['', '100n', '10k']
+    assert sorted(store.distinctValues(2)) == ['', '0402', '0603']
+    assert store.distinctValues(7) == []
+
+
+def test_cells_and_columns_past_the_end_are_blank():
+    store = ColumnStore(ROWS)
+
+    assert store.cell(1, 2) == ''
+    assert store.cell(0, 9) == ''
+    assert store.column(3) == ['', '', '', '', 'X7R']
+    assert store.column(9) == [''] * len(ROWS)
+    assert store.column(0, [4, 0]) == ['C1', 'R1']
+    assert store.column(-1, [0, 1]) == ['', '']
+
+
+def test_row_lengths():
+    store = ColumnStore(ROWS)
+
+    assert [store.rowLength(i) for i in range(len(ROWS))] == [3, 2, 0, 3, 4]
+    assert store.nonEmptyRows() == [0, 1, 3, 4]
+
+
+def test_from_columns():
+    store = ColumnStore.fromColumns([['a', 'b'], ['1', '']])
+
+    assert list(store) == [['a', '1'], ['b', '']]
+    assert list(ColumnStore.fromColumns([])) == []
+
+
+def test_set_extends_rows_and_columns():
+    store = ColumnStore(ROWS)
+
+    store.set(2, 1, 'new')
+    store.set(1, 5, 'far')
+    store.set(0, 1, '')
+
+    assert store[2] == ['', 'new']
+    assert store[1] == ['R2', '10k', '', '', '', 'far']
+    assert store[0] == ['R1', '', '0402']
+    assert store.rowLength(1) == 6
+
+
+def test_codes_widen_past_one_byte():
+    values = [str(i) for i in range(300)]
+    store = ColumnStore([[v] for v in values])
+
+    assert store.column(0) == values
+
+    # Enough new values through set() to outgrow a one byte column.
+    store = ColumnStore([['x']] * 300)
+    for i in range(300):
+        store.set(i, 1, values[i])
+
+    assert store.column(1) == values
+    assert store.column(0) == ['x'] * 300
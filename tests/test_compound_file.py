@@ -0,0 +1,99 @@
+# MIT License
+#
+# Copyright 2021 Jonathan Nutzmann
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import struct
+
+import pytest
+
+from altium_gsheet_library.benchmarks.library_fixtures import writeCompoundFile
+from altium_gsheet_library.compound_file import CompoundFile
+
+
+def writeFile(tmp_path, tree):
+    path = tmp_path / 'test.SchLib'
+    writeCompoundFile(str(path), tree)
+    return bytearray(path.read_bytes())
+
+
+def readAll(compound_file):
+    return dict((path, compound_file.readStream(index)) 
+                for path, index in compound_file.iterStreams())
+
+
+def test_reads_mini_and_regular_streams(tmp_path):
+    # Several small streams, so the mini stream spans more than one regular
+    # sector, and large ones that follow FAT chains over several sectors.
+    tree = {
+        'FileHeader': b'|HEADER=Protel for Windows',
+        'Storage': dict(('Small%i' % i, bytes([i]) * 300) for i in range(4)),
+        'Large': bytes(range(256)) * 20,
+        'Cutoff': b'x' * 4096,
+        'Empty': b''
+    }
+
+    streams = readAll(CompoundFile(writeFile(tmp_path, tree)))
+
+    assert streams[('FileHeader',)] == tree['FileHeader']
+    assert streams[('Large',)] == tree['Large']
+    assert streams[('Cutoff',)] == tree['Cutoff']
+    assert streams[('Empty',)] == b''
+    for name in tree['Storage']:
+        assert streams[('Storage', name)] == tree['Storage'][name]
+    assert len(streams) == 8
+
+
+def test_rejects_other_files():
+    with pytest.raises(Exception):
+        CompoundFile(b'\x00' * 1024)
+
+    assert not CompoundFile.isCompoundFile(b'\xd0\xcf\x11\xe0')
+
+
+def test_fat_loops_do_not_hang(tmp_path):
+    data = writeFile(tmp_path, {'Large': b'y' * 5000})
+    compound_file = CompoundFile(data)
+    (path, index), = compound_file.iterStreams()
+
+    # Point the last sector of the stream back at its first one.
+    start = compound_file._entries[index]['start']
+    last = start
+    while compound_file._fat[last] < len(compound_file._fat):
+        last = compound_file._fat[last]
+    struct.pack_into('<I', data, 512 + 4 * last, start)
+
+    compound_file = CompoundFile(data)
+    assert compound_file.readStream(index) == b'y' * 5000
+    assert len(list(compound_file._chain(start, compound_file._fat))) == \
+        len(compound_file._fat)
+
+
+def test_directory_loops_do_not_hang(tmp_path):
+    data = writeFile(tmp_path, {'A': b'a', 'B': b'b'})
+
+    # Siblings are chained through their right pointers: make the last one
+    # point back at the first.
+    directory_start, = struct.unpack_from('<I', data, 0x30)
+    struct.pack_into('<I', data, 512 * (directory_start + 1) + 2 * 128 + 72, 1)
+
+    assert readAll(CompoundFile(data)) == {('A',): b'a', ('B',): b'b'}
@@ -0,0 +1,96 @@
+# MIT License
+#
+# Copyright 2021 Jonathan Nutzmann
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import configparser
+
+import pytest
+
+from altium_gsheet_library.database import (LibraryDatabase, 
+                                            escapeLoadDataValue, padRow)
+
+
+@pytest.fixture
+def db():
+    config = configparser.ConfigParser()
+    config.read_dict({'database': {
+        'backend': 'sqlite',
+        'path': ':memory:',
+        'sync_mode': 'incremental',
+        'search_table': '',
+        'insert_batch_size': '2'
+    }})
+    db = LibraryDatabase(config['database'])
+    db._cursor.execute('CREATE TABLE parts (id INTEGER PRIMARY KEY, '
+                       'component_id TEXT, value TEXT, footprint TEXT)')
+    yield db
+    db.close()
+
+
+def tableRows(db):
+    db._cursor.execute('SELECT component_id, value, footprint FROM parts '
+                       'ORDER BY component_id')
+    return [list(r) for r in db._cursor.fetchall()]
+
+
+def test_escape_load_data_value():
+    assert escapeLoadDataValue(None) == '\\N'
+    assert escapeLoadDataValue('plain') == 'plain'
+    assert escapeLoadDataValue(12) == '12'
+    assert escapeLoadDataValue('a\tb\nc\rd') == 'a\\tb\\nc\\rd'
+    assert escapeLoadDataValue('C:\\lib\\R.SchLib') == 'C:\\\\lib\\\\R.SchLib'
+    assert escapeLoadDataValue('nul\0') == 'nul\\0'
+    # The backslash is escaped first, so escapes are not doubled.
+    assert escapeLoadDataValue('\\\t') == '\\\\\\t'
+    assert escapeLoadDataValue('\\N') == '\\\\N'
+
+
+def test_pad_row():
+    assert padRow(['a'], 3) == ['a', None, None]
+    assert padRow(['a', 'b', 'c', 'd'], 3) == ['a', 'b', 'c']
+    assert padRow((), 2) == [None, None]
+
+
+def test_sync_rows_only_changes_what_differs(db):
+    columns = ['component_id', 'value', 'footprint']
+    db.syncRows('parts', columns, [['1', '10k', '0402'], ['2', '1k', '0402'],
+                                   ['3', '100n']])
+    db.commit()
+
+    assert tableRows(db) == [['1', '10k', '0402'], ['2', '1k', '0402'],
+                             ['3', '100n', None]]
+
+    counts = db.syncRows('parts', columns, [
+        ['1', '10k', '0402'],           # unchanged
+        ['3', '100n', '0603'],          # updated
+        ['4', '22p', '0402']            # inserted, and 2 is deleted
+    ])
+    db.commit()
+
+    assert counts == (1, 1, 1)
+    assert tableRows(db) == [['1', '10k', '0402'], ['3', '100n', '0603'],
+                             ['4', '22p', '0402']]
+
+    # Nothing changed, nothing to do.
+    assert db.syncRows('parts', columns, [['1', '10k', '0402'], 
+        ['3', '100n', '0603'], ['4', '22p', '0402']]) == (0, 0, 0)
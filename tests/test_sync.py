@@ -0,0 +1,96 @@
+# MIT License
+#
+# Copyright 2021 Jonathan Nutzmann
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import contextlib
+import io
+import os
+from argparse import Namespace
+
+import pytest
+
+from altium_gsheet_library import sync
+from altium_gsheet_library.benchmarks import sync_benchmark
+from altium_gsheet_library.benchmarks.fake_google import FakeSpreadsheets
+from altium_gsheet_library.benchmarks.library_fixtures import generateLibraries
+from altium_gsheet_library.benchmarks.synthetic_sheet import generateSheet
+from altium_gsheet_library.database import LibraryDatabase
+from altium_gsheet_library.gsheet import GSheetReader
+
+
+@pytest.fixture
+def library(tmp_path):
+    # A cached sync of a small synthetic spreadsheet into a SQLite file.
+    work_dir = str(tmp_path)
+    args = Namespace(memory=False, sync_mode='recreate', insert_batch_size=1000,
+                     spreadsheets=1, cache=True, batch_read=True, stream_window=0,
+                     read_workers=2, requests_per_minute=100000, 
+                     library_workers=1, snapshots=False)
+
+    symbol_files, footprint_files = generateLibraries(
+        os.path.join(work_dir, 'library'), 2, 10, 0)
+    sheets = FakeSpreadsheets(sync_benchmark.SHEET_ID, generateSheet(
+        2, 5, 10, symbol_files, footprint_files, 0, 0, 0))
+    config = sync_benchmark.makeConfig(work_dir, args)
+    db = LibraryDatabase(config.get('database'))
+
+    def runSync(force=False):
+        reader = GSheetReader(config.get('gsheet'), sheets=sheets, 
+                              files=sheets.files())
+        with contextlib.redirect_stdout(io.StringIO()):
+            return sync.runSync(config, db, reader, force=force)
+
+    yield db, runSync
+    db.close()
+
+
+def rowCount(db, table):
+    db._cursor.execute('SELECT COUNT(*) FROM `%s`' % table)
+    return db._cursor.fetchone()[0]
+
+
+def test_unchanged_sheet_is_skipped(library):
+    db, runSync = library
+
+    assert runSync()
+    assert not runSync()
+    assert rowCount(db, 'Category 000') == 5
+
+
+def test_failed_sync_is_not_left_as_unchanged(library):
+    db, runSync = library
+
+    assert runSync()
+
+    def failLoad(*args):
+        raise Exception('load failed')
+
+    db.loadRows = failLoad
+    with pytest.raises(Exception, match='load failed'):
+        runSync(force=True)
+    del db.loadRows
+
+    # The sheet has not changed since the last good sync, but the failed one
+    # emptied the tables, so the next sync has to load them again.
+    assert runSync()
+    assert rowCount(db, 'Category 000') == 5
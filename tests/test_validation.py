@@ -0,0 +1,83 @@
+# MIT License
+#
+# Copyright 2021 Jonathan Nutzmann
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+from altium_gsheet_library.column_store import ColumnStore
+from altium_gsheet_library.models import Category, Field
+from altium_gsheet_library.validation import LibraryValidator, NGramIndex
+
+
+def test_ngram_suggestions():
+    index = NGramIndex(['resistors.schlib', 'capacitors.schlib', 
+                        'inductors.schlib'])
+
+    assert index.suggest('resistor.schlib') == ['resistors.schlib']
+    assert index.suggest('Capacitors.SchLib')[0] == 'capacitors.schlib'
+    assert index.suggest('zzz') == []
+    assert len(index.suggest('s.schlib', limit=2, min_score=0)) == 2
+
+
+def test_ngram_index_ignores_repeated_words():
+    index = NGramIndex(['RES_0402'])
+    index.add('RES_0402')
+
+    assert index.suggest('RES_0402') == ['RES_0402']
+
+
+def makeCategory(rows):
+    category = Category('Resistors', len(rows))
+    for name in ['Component ID', 'Library Ref', 'Library Path', 
+                 'Footprint Ref', 'Footprint Path']:
+        category.add_field(Field(name))
+    category.raw_rows = ColumnStore(rows)
+    return category
+
+
+def test_validate_category():
+    validator = LibraryValidator(
+        {'resistors.schlib': ['RES', 'RES_ARRAY']},
+        {'chip.pcblib': ['0402', '0603']})
+
+    validator.validateCategory(makeCategory([
+        ['1', 'RES', 'Resistors.SchLib', '0402', 'chip.PcbLib'],
+        ['2', 'RESS', 'resistors.schlib', '0603', 'chips.pcblib'],
+        [],
+        ['3', 'RES', '', '0402', 'chip.pcblib']
+    ]))
+
+    assert validator.checked == 3
+    assert validator.counts() == {'warning': 2, 'info': 1}
+
+    issues = dict(((i['component_id'], i['code']), i) 
+                  for i in validator.issues)
+
+    name = issues[('2', 'name_not_found')]
+    assert name['kind'] == 'symbol'
+    assert name['row'] == 3
+    assert name['suggestions'][0] == 'RES'
+
+    path = issues[('2', 'file_not_found')]
+    assert path['kind'] == 'footprint'
+    assert path['suggestions'] == ['chip.pcblib']
+
+    assert issues[('3', 'path_missing')]['row'] == 5
@@ -0,0 +1,199 @@
+# MIT License
+#
+# Copyright 2021 Jonathan Nutzmann
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import json
+
+from termcolor import colored
+
+
+class NGramIndex:
+
+    # Finds near misses for misspelled names by the character trigrams they
+    # share with known names.
+
+    def __init__(self, words=[], n=3):
+        self._n = n
+        self._grams = {}
+        self._sizes = {}
+
+        for w in words:
+            self.add(w)
+
+    def _ngrams(self, word):
+        word = ' %s ' % word.lower()
+        return set(word[i:i + self._n] for i in range(len(word) - self._n + 1))
+
+    def add(self, word):
+        if word in self._sizes:
+            return
+
+        grams = self._ngrams(word)
+        self._sizes[word] = len(grams)
+        for g in grams:
+            self._grams.setdefault(g, set()).add(word)
+
+    def suggest(self, word, limit=3, min_score=0.5):
+        grams = self._ngrams(word)
+        shared = {}
+
+        for g in grams:
+            for w in self._grams.get(g, ()):
+                shared[w] = shared.get(w, 0) + 1
+
+        scored = []
+        for w in shared:
+            # Dice coefficient of the two trigram sets.
+            score = 2.0 * shared[w] / (len(grams) + self._sizes[w])
+            if score >= min_score:
+                scored.append((score, w))
+
+        scored.sort(key=lambda s: (-s[0], s[1]))
+
+        return [w for score, w in scored[:limit]]
+
+
+class LibraryValidator:
+
+    # Checks the symbol and footprint references of whole categories against
+    # the libraries found by getLibraryFiles, collecting the problems into a
+    # single report instead of printing them row by row.
+
+    def __init__(self, symbol_files, footprint_files):
+        self._files = {
+            'symbol': dict((f, set(symbol_files[f])) for f in symbol_files),
+            'footprint': dict((f, set(footprint_files[f])) for f in footprint_files)
+        }
+
+        self._file_suggestions = {
+            'symbol': NGramIndex(symbol_files),
+            'footprint': NGramIndex(footprint_files)
+        }
+
+        self._name_suggestions = {'symbol': NGramIndex(), 'footprint': NGramIndex()}
+        for kind in self._files:
+            for f in self._files[kind]:
+                for name in self._files[kind][f]:
+                    self._name_suggestions[kind].add(name)
+
+        # The same misspelling is usually repeated down a whole category.
+        self._suggestion_cache = {}
+
+        self.issues = []
+        self.checked = 0
+
+    def validateCategory(self, category):
+
+        # Only the columns that are checked are decoded.
+        rows = category.raw_rows
+        component_ids = rows.column(category.field_index('component_id'))
+        references = [
+            ('symbol', rows.column(category.field_index('library_path')),
+                       rows.column(category.field_index('library_ref'))),
+            ('footprint', rows.column(category.field_index('footprint_path')),
+                          rows.column(category.field_index('footprint_ref')))
+        ]
+
+        for row_index in rows.nonEmptyRows():
+            self.checked += 1
+            component_id = component_ids[row_index]
+
+            for kind, paths, names in references:
+                path = paths[row_index].lower()
+                name = names[row_index]
+
+                if len(path) == 0:
+                    self._addIssue('info', kind, 'path_missing', category.name,
+                        component_id, row_index + category.first_row,
+                        '%s path not specified.' % kind)
+
+                elif path not in self._files[kind]:
+                    self._addIssue('warning', kind, 'file_not_found',
+                        category.name, component_id, row_index + category.first_row,
+                        'file "%s" not found in %s folder.' % (path, kind),
+                        self._suggest(self._file_suggestions[kind], path))
+
+                elif name not in self._files[kind][path]:
+                    self._addIssue('warning', kind, 'name_not_found',
+                        category.name, component_id, row_index + category.first_row,
+                        'file "%s" does not contain the expected %s "%s".'
+                        % (path, kind, name),
+                        self._suggest(self._name_suggestions[kind], name))
+
+        return self.issues
+
+    def _suggest(self, index, word):
+        key = (id(index), word)
+        if key not in self._suggestion_cache:
+            self._suggestion_cache[key] = index.suggest(word)
+        return self._suggestion_cache[key]
+
+    def _addIssue(self, level, kind, code, category, component_id, row, message,
+                  suggestions=[]):
+        self.issues.append({
+            'level': level,
+            'kind': kind,
+            'code': code,
+            'category': category,
+            'component_id': component_id,
+            'row': row,
+            'message': message,
+            'suggestions': suggestions
+        })
+
+    def counts(self):
+        counts = {}
+        for i in self.issues:
+            counts[i['level']] = counts.get(i['level'], 0) + 1
+        return counts
+
+    def printSummary(self):
+        counts = self.counts()
+
+        print('Checked %i components: %i warnings, %i info.' % (self.checked,
+              counts.get('warning', 0), counts.get('info', 0)))
+
+        # Group by category and problem, so a category with a wrong library
+        # path prints one line instead of one per component.
+        groups = {}
+        for i in self.issues:
+            key = (i['category'], i['level'], i['message'])
+            if key not in groups:
+                groups[key] = [0, i['suggestions']]
+            groups[key][0] += 1
+
+        for (category, level, message), (count, suggestions) in sorted(groups.items()):
+            line = ' -> %s: %s (%s, %i components)' % (level.capitalize(),
+                    message, category, count)
+            if len(suggestions) > 0:
+                line += ' Did you mean: %s?' % ', '.join(
+                    '"%s"' % s for s in suggestions)
+            print(colored(line, 'yellow' if level == 'warning' else 'blue'))
+
+    def writeReport(self, filename):
+        with open(filename, 'w') as f:
+            json.dump({
+                'checked': self.checked,
+                'counts': self.counts(),
+                'issues': self.issues
+            }, f, indent=2)
+